@@ -0,0 +1,196 @@
+import gzip
+import lzma
+import os
+from collections import OrderedDict
+
+from storage import EntryStore, normalize_party
+from snapshot import Snapshot, snapshot_bytes
+
+# --- Cold storage tier ---
+# Entries and notes dated before a cutoff move out of the database into one compressed snapshot per financial year
+# ("2023-24" runs 2023-04-01..2024-03-31). The database keeps only the archives table and a bill -> year index;
+# rollups, outstanding balances and the month manifest are left in place, so the dashboard and filters still see
+# the archived years. An archive is decompressed only when a query reaches into its year, and the last few opened
+# stay in memory. Archived days are read-only.
+ARCHIVE_CODECS = {"xz": lzma, "gz": gzip}
+OPEN_ARCHIVES = 2
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (year TEXT PRIMARY KEY, file TEXT NOT NULL, entries INTEGER NOT NULL, notes INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS archive_bills (bill TEXT NOT NULL, year TEXT NOT NULL, PRIMARY KEY (bill, year));
+"""
+
+def financial_year(date):
+    year, month = int(date[:4]), int(date[5:7])
+    start = year if month >= 4 else year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+def financial_year_bounds(year):
+    start = int(year[:4])
+    return f"{start}-04-00", f"{start + 1}-03-99"
+
+class ArchivedStore(EntryStore):
+    def __init__(self, path, archive_dir=None, read_only=False):
+        super().__init__(path, read_only)
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(os.path.abspath(path)), "archive")
+        if not read_only: self.conn.executescript(ARCHIVE_SCHEMA)
+        self._open_archives = OrderedDict()  # year -> Snapshot
+        self._archived_bills = {}  # year -> {bill: latest archived entry}, built only for bill lookups
+
+    # --- Archive files ---
+    def archived_before(self):
+        # Cutoff of the archived range (exclusive); "" while nothing has been archived.
+        def load():
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'archived_before'").fetchone()
+            return row[0] if row else ""
+        return self._cached(("archived_before",), load)
+
+    def _archive(self, year):
+        if year in self._open_archives:
+            self._open_archives.move_to_end(year)
+            return self._open_archives[year]
+        row = self.conn.execute("SELECT file FROM archives WHERE year = ?", (year,)).fetchone()
+        if row is None: return None
+        path = os.path.join(self.archive_dir, row[0])
+        if os.path.exists(path + ".tmp"): os.replace(path + ".tmp", path)  # finish a rename cut short after its commit
+        with ARCHIVE_CODECS[row[0].rsplit(".", 1)[1]].open(path, "rb") as f: snapshot = Snapshot(data=f.read())
+        self._open_archives[year] = snapshot
+        while len(self._open_archives) > OPEN_ARCHIVES: self._archived_bills.pop(self._open_archives.popitem(last=False)[0], None)
+        return snapshot
+
+    def _archived_days(self, user, date_from, date_to, years=None, reverse=False):
+        # (date, entries, notes) from every archive overlapping the range (or only those in `years`), in date order
+        # or newest first.
+        if date_from >= self.archived_before(): return
+        for (year,) in self.conn.execute(f"SELECT year FROM archives ORDER BY year {'DESC' if reverse else ''}").fetchall():
+            first, last = financial_year_bounds(year)
+            if last < date_from or first > date_to or (years is not None and year not in years): continue
+            yield from self._archive(year).days_between(date_from, date_to, user, reverse)
+
+    def archive_before(self, cutoff, codec="xz"):
+        # Moves everything dated before `cutoff` into per-year archives, merging with any archive already written
+        # for that year. Returns the number of entries moved. Manages its own transactions, so it must not run
+        # inside batch() (see IOWorker.write_alone). Each year is one step: write "<file>.tmp", commit the database,
+        # then rename over the old file. A failure before the commit leaves that year untouched; one after it is
+        # finished by _archive, which completes a pending rename before reading.
+        os.makedirs(self.archive_dir, exist_ok=True)
+        dates = self.conn.execute("SELECT date FROM entries WHERE date < ? UNION SELECT date FROM notes WHERE date < ?", (cutoff, cutoff)).fetchall()
+        moved = 0
+        for year in sorted({financial_year(d) for (d,) in dates}):
+            first, last = financial_year_bounds(year)
+            last = min(last, cutoff)
+            entries = self.conn.execute("SELECT id, user, date, bill, party, credit, payment, \"return\", discount, balance FROM entries WHERE date >= ? AND date < ? ORDER BY date, rowid", (first, last)).fetchall()
+            notes = [(r['user'], r['date'], {'description': r['description'], 'amount': r['amount']}) for r in self.conn.execute("SELECT user, date, description, amount FROM notes WHERE date >= ? AND date < ? ORDER BY date, rowid", (first, last))]
+            entries = [dict(r) for r in entries]
+            previous = self.conn.execute("SELECT file FROM archives WHERE year = ?", (year,)).fetchone()
+            if previous:
+                snapshot = self._archive(year)
+                entries = [dict(e) for e in snapshot.iter_entries()] + entries
+                notes = list(snapshot.iter_notes()) + notes
+            name = f"dsr-{year}.dsrs.{codec}"
+            path = os.path.join(self.archive_dir, name)
+            try:
+                with ARCHIVE_CODECS[codec].open(path + ".tmp", "wb") as f: f.write(snapshot_bytes(entries, notes))
+                with self.conn:
+                    self.conn.execute("INSERT OR REPLACE INTO archives (year, file, entries, notes) VALUES (?, ?, ?, ?)", (year, name, len(entries), len(notes)))
+                    self.conn.execute("INSERT OR IGNORE INTO archive_bills (bill, year) SELECT DISTINCT bill, ? FROM entries WHERE date >= ? AND date < ?", (year, first, last))
+                    moved += self.conn.execute("DELETE FROM entries WHERE date >= ? AND date < ?", (first, last)).rowcount
+                    self.conn.execute("DELETE FROM notes WHERE date >= ? AND date < ?", (first, last))
+                    # Everything before this year's end is archived now, even if a later year fails.
+                    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('archived_before', ?)", (max(last, self.archived_before()),))
+            except BaseException:
+                if os.path.exists(path + ".tmp"): os.remove(path + ".tmp")
+                raise
+            finally:
+                self._cache.pop(("archived_before",), None)
+                self._latest_by_bill = self._parties = None
+            self._open_archives.pop(year, None); self._archived_bills.pop(year, None)
+            os.replace(path + ".tmp", path)
+            if previous and previous[0] != name: os.remove(os.path.join(self.archive_dir, previous[0]))  # re-archived with another codec
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('archived_before', ?)", (max(cutoff, self.archived_before()),))
+        self._cache.pop(("archived_before",), None)
+        self._maybe_compact()
+        return moved
+
+    # --- Reads that reach into archived years ---
+    def entries_for_day(self, user, date):
+        if date < self.archived_before(): return [e for _, entries, _ in self._archived_days(user, date, date) for e in entries]
+        return super().entries_for_day(user, date)
+
+    def notes_for_day(self, user, date):
+        if date < self.archived_before(): return [n for _, _, notes in self._archived_days(user, date, date) for n in notes]
+        return super().notes_for_day(user, date)
+
+    def _archived_latest(self, bill):
+        row = self.conn.execute("SELECT year FROM archive_bills WHERE bill = ? ORDER BY year DESC LIMIT 1", (bill,)).fetchone()
+        if row is None: return None
+        year, snapshot = row[0], self._archive(row[0])
+        if year not in self._archived_bills:
+            # Decodes the whole year, so only bill lookups pay for it; records are in date order, so the last per bill wins.
+            self._archived_bills[year] = {e.bill: e for e in snapshot.iter_entries()}
+        return self._archived_bills[year].get(bill)
+
+    def latest_for_bill(self, bill):
+        if (found := super().latest_for_bill(bill)) is not None: return found
+        return self._archived_latest(bill)
+
+    def _balance_source(self, bill):
+        # Once a bill's hot entries are gone its outstanding balance is the archived latest entry's, not zero.
+        if (found := super()._balance_source(bill)) is not None: return found
+        return self._archived_latest(bill)
+
+    def find_entries(self, user=None, date=None, party=None, bill=None, order_by=("date", "bill")):
+        # A date opens only its own year's archive and a bill only the years the index places it in; without either
+        # the listing covers every archived year, like the rollup totals shown next to it.
+        if date and date >= self.archived_before(): return super().find_entries(user, date, party, bill, order_by)
+        if date: archived = [e for _, entries, _ in self._archived_days(user, date, date) for e in entries]
+        elif bill:
+            years = [y for (y,) in self.conn.execute("SELECT year FROM archive_bills WHERE bill = ?", (bill,))]
+            archived = [e for y in years for e in self._archive(y).iter_entries() if e.bill == bill and (user is None or e.user == user)]
+        else: archived = [e for _, entries, _ in self._archived_days(user, "0000-00-00", "9999-99-99") for e in entries]
+        if party: archived = [e for e in archived if normalize_party(party) in normalize_party(e.party)]
+        if bill: archived = [e for e in archived if e.bill == bill]
+        entries = super().find_entries(user, date, party, bill, order_by) + archived
+        entries.sort(key=lambda e: tuple(e[c] for c in order_by), reverse=True)
+        return entries
+
+    def page_entries(self, user=None, month=None, after=None, limit=50):
+        # Newest first: the database's keyset pages, then (all older) archived days, newest year first. Archive pages
+        # carry an ("archive", date, skip) cursor: continue at `date`, past the first `skip` of that day's entries.
+        if after is None or after[0] != "archive":
+            rows, cursor = super().page_entries(user, month, after, limit)
+            if cursor is not None: return rows, cursor
+            start, skip = (f"{month}-99" if month else "9999-99-99"), 0
+        else: rows, (_, start, skip) = [], after
+        for date, entries, _ in self._archived_days(user, f"{month}-00" if month else "0000-00-00", start, reverse=True):
+            day = sorted(entries, key=lambda e: e.user, reverse=True)  # the database pages' (date, user) order
+            offset = skip if date == start else 0
+            if len(day) - offset > (room := limit - len(rows)): return rows + day[offset:offset + room], ("archive", date, offset + room)
+            rows += day[offset:]
+        return rows, None
+
+    def iter_entries(self, user, date_from, date_to, chunk_size=500):
+        for _, entries, _ in self._archived_days(user, date_from, date_to): yield from entries
+        yield from super().iter_entries(user, date_from, date_to, chunk_size)
+
+    def iter_filtered(self, user=None, date_from=None, date_to=None, party=None, bill=None, chunk_size=500):
+        # Archived years are all older than the database's, so they stream first; a bill only opens the years it is in.
+        years = {y for (y,) in self.conn.execute("SELECT year FROM archive_bills WHERE bill = ?", (bill,))} if bill else None
+        fragment = normalize_party(party or "")
+        for _, entries, _ in self._archived_days(user, date_from or "0000-00-00", date_to or "9999-99-99", years):
+            yield from (e for e in entries if (not bill or e.bill == bill) and fragment in normalize_party(e.party))
+        yield from super().iter_filtered(user, date_from, date_to, party, bill, chunk_size)
+
+    def day_snapshots(self, users, date_from, date_to):
+        if users is None: users = self.entry_users()
+        snapshots = []
+        for user in users:
+            snapshots.extend((user, date, [dict(e) for e in entries], notes) for date, entries, notes in self._archived_days(user, date_from, date_to))
+            snapshots.extend(super().day_snapshots([user], date_from, date_to))
+        return snapshots
+
+    # --- Archived days are read-only ---
+    def replace_day(self, user, date, entries, notes):
+        if date < self.archived_before(): raise ValueError(f"Entries before {self.archived_before()} are archived and read-only.")
+        return super().replace_day(user, date, entries, notes)
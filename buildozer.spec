@@ -7,7 +7,7 @@ source.include_exts = py,png,jpg,kv,atlas,json
 version = 1.0
 
 # Humne Kivy, Pillow, aur reportlab, teeno ka version fix kar diya hai
-requirements = python3,kivy==2.1.0,reportlab==3.6.13,Pillow==9.3.0
+requirements = python3,sqlite3,kivy==2.1.0,reportlab==3.6.13,Pillow==9.3.0
 
 orientation = portrait
 fullscreen = 0
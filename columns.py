@@ -0,0 +1,46 @@
+try:
+    import numpy as np
+except ImportError:  # optional: only the range-wide summary reports need it
+    np = None
+
+HAVE_NUMPY = np is not None
+MONEY_FIELDS = ("credit", "payment", "return", "discount", "balance")
+CODED_FIELDS = ("user", "party", "date")
+
+# --- Columnar entry snapshot ---
+# Column-major copy of a range of entries for month- and year-level aggregation: one float64 array per money
+# column and integer codes into sorted vocabularies for user, party and date. Group sums are bincounts, so
+# nothing loops over entry dicts in Python once the snapshot is built.
+class EntryColumns:
+    def __init__(self, entries):
+        if np is None: raise RuntimeError("numpy is not installed; columnar reports are unavailable")
+        raw = {f: [] for f in CODED_FIELDS + MONEY_FIELDS}
+        for e in entries:
+            for f, values in raw.items(): values.append(e.get(f) or (0.0 if f in MONEY_FIELDS else ""))
+        self.size = len(raw["user"])
+        self.money = {f: np.asarray(raw[f], dtype=np.float64) for f in MONEY_FIELDS}
+        self.vocab, self.codes = {}, {}
+        for f in CODED_FIELDS:
+            # Sorted vocabularies keep code order equal to value order, so groups come out ordered by key.
+            self.vocab[f], self.codes[f] = np.unique(np.asarray(raw[f], dtype=str), return_inverse=True)
+        months, self.month_of_date = np.unique(self.vocab["date"].astype("U7"), return_inverse=True)
+        self.vocab["month"] = months
+
+    def _group_codes(self, field):
+        if field == "month": return self.month_of_date[self.codes["date"]]
+        return self.codes[field]
+
+    def group_sum(self, by, fields=MONEY_FIELDS):
+        # [(key tuple, {"entries": n, field: sum, ...})] for every non-empty group of the `by` fields
+        # ("user", "party", "date" or "month"), ordered by key.
+        combined = np.zeros(self.size, dtype=np.int64)
+        for field in by: combined = combined * len(self.vocab[field]) + self._group_codes(field)
+        groups, inverse = np.unique(combined, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(groups))
+        sums = {f: np.bincount(inverse, weights=self.money[f], minlength=len(groups)) for f in fields}
+        keys = []
+        for field in reversed(by):
+            groups, codes = np.divmod(groups, len(self.vocab[field]))
+            keys.append(self.vocab[field][codes])
+        keys.reverse()
+        return [(tuple(str(k[i]) for k in keys), {"entries": int(counts[i]), **{f: float(sums[f][i]) for f in fields}}) for i in range(len(counts))]
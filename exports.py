@@ -0,0 +1,62 @@
+import argparse
+import csv
+import sys
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # optional: only XLSX export needs it, CSV always works
+    Workbook = None
+
+from archive import ArchivedStore
+
+HAVE_OPENPYXL = Workbook is not None
+EXPORT_COLUMNS = (("date", "Date"), ("user", "User"), ("bill", "Bill No"), ("party", "Party Name"), ("credit", "Credit"),
+                  ("payment", "Payment"), ("return", "Return"), ("discount", "Discount"), ("balance", "Balance"))
+EXPORT_PROGRESS_ROWS = 1000  # rows between progress callbacks
+
+# --- Spreadsheet export ---
+# Rows go from the store's cursor straight into the file: csv.writer for CSV, openpyxl's write-only workbook for
+# XLSX (it spools rows to a temporary file instead of keeping cells). Memory stays flat however many rows match.
+def _stream(entries, append, progress):
+    append([label for _, label in EXPORT_COLUMNS])
+    count = 0
+    for count, entry in enumerate(entries, 1):
+        append([entry[key] for key, _ in EXPORT_COLUMNS])
+        if progress and count % EXPORT_PROGRESS_ROWS == 0: progress(count)
+    return count
+
+def write_csv(filename, entries, progress=None):
+    # utf-8-sig so Excel picks up non-ASCII party names; returns the number of rows written.
+    with open(filename, "w", newline="", encoding="utf-8-sig") as f: return _stream(entries, csv.writer(f).writerow, progress)
+
+def write_xlsx(filename, entries, progress=None):
+    if Workbook is None: raise RuntimeError("openpyxl is not installed; XLSX export is unavailable")
+    book = Workbook(write_only=True)
+    count = _stream(entries, book.create_sheet("Ledger").append, progress)
+    book.save(filename)
+    return count
+
+def export_from_db(db_path, filename, user=None, date_from=None, date_to=None, party=None, bill=None, progress=None):
+    # Own connection, so it can run on the report thread; the format follows the file extension.
+    write = write_xlsx if filename.lower().endswith(".xlsx") else write_csv
+    store = ArchivedStore(db_path, read_only=True)
+    try: return write(filename, store.iter_filtered(user, date_from, date_to, party, bill), progress)
+    finally: store.close()
+
+def main(argv=None):
+    # Headless entry point: python exports.py ledger.csv --user alice --from 2024-04-01 --to 2025-03-31
+    parser = argparse.ArgumentParser(description="Export DSR entries matching the ledger filters to CSV or XLSX.")
+    parser.add_argument("output", help="output file; .xlsx writes a workbook (needs openpyxl), anything else CSV")
+    parser.add_argument("--db", default="dsr.db", help="database file (default: dsr.db)")
+    parser.add_argument("--user", help="only this user's entries")
+    parser.add_argument("--from", dest="date_from", help="first date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="last date, YYYY-MM-DD")
+    parser.add_argument("--party", help="party name fragment")
+    parser.add_argument("--bill", help="exact bill number")
+    args = parser.parse_args(argv)
+    count = export_from_db(args.db, args.output, args.user, args.date_from, args.date_to, args.party, args.bill)
+    print(f"Wrote {count} row(s) to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,27 @@
-import json
 import os
+import calendar
 import datetime
+from collections import deque
+from functools import partial
 
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.label import Label
+from kivy.uix.widget import Widget
 from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
 from kivy.uix.popup import Popup
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.spinner import Spinner
+from kivy.uix.dropdown import DropDown
+from kivy.uix.progressbar import ProgressBar
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.core.window import Window
+from kivy.clock import Clock
 from kivy.graphics import Color, Rectangle, RoundedRectangle
 from kivy.metrics import dp
 from kivy import platform
@@ -24,23 +33,33 @@ if platform == 'android':
     except ImportError:
         pass
 
-# PDF Generation Library
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
+from storage import DayCache, Entry, IOWorker, month_bounds, new_entry_id
+from archive import ArchivedStore
+from reports import ReportQueue
+from columns import HAVE_NUMPY
+from exports import HAVE_OPENPYXL
+from snapshot import load_legacy
 
 # --- Basic Setup & Helpers ---
 Window.clearcolor = (0.2, 0.2, 0.2, 1)
 DATA_FILE, USERS_FILE, NOTES_FILE, ADMIN_USER, ADMIN_PASS = "data.json", "users.json", "notes.json", "sabeer125", "qw4hd"
+DB_FILE = "dsr.db"  # Legacy JSON files above are only read once, to migrate them into this database.
+SNAPSHOT_FILE = "data.dsrs"  # Binary snapshot of data.json + notes.json (see snapshot.py); migrated instead of them when present.
+ARCHIVE_KEEP_YEARS = 2  # financial years (current one included) that stay in the database when archiving
+BILL_LOOKUP_DELAY = 0.3  # seconds of typing inactivity before a bill prefill lookup
+ADMIN_PAGE_SIZE, ADMIN_CARD_HEIGHT = 50, dp(244)
+DSR_ROW_POOL_SIZE, NOTE_ROW_POOL_SIZE = 40, 10  # detached rows kept for reuse across date switches
 
-def load_json(f, d):
-    if not os.path.exists(f) or os.path.getsize(f) == 0: return d
-    try:
-        with open(f, "r") as fp: return json.load(fp)
-    except (json.JSONDecodeError, FileNotFoundError): return d
+def get_store(): return App.get_running_app().store
+
+def get_io(): return App.get_running_app().io
+
+def forget_day(user, date): App.get_running_app().day_cache.invalidate((user, date))
+
+def forget_entries(entries):
+    for entry in entries: forget_day(entry['user'], entry['date'])
 
-def save_json(f, d):
-    with open(f, "w") as fp: json.dump(d, fp, indent=4)
+def deliver_on_main_thread(callback, *args): Clock.schedule_once(lambda dt: callback(*args))
 
 def verify_password(p, s): return p == s
 
@@ -107,6 +126,65 @@ class EditDsrPopup(Popup):
             self.save_callback(self.original_entry, updated_entry); self.dismiss()
         except ValueError: App.get_running_app().root.get_screen('admin').show_popup("Error", "Please enter valid numbers.")
 
+class PdfProgressPopup(Popup):
+    def __init__(self, filename, queued=0, **kwargs):
+        super().__init__(**kwargs); self.title = "Generating PDF"; self.size_hint = (0.9, None); self.height = dp(220)
+        layout = BoxLayout(orientation='vertical', padding=dp(10), spacing=dp(10))
+        self.status_label = StyledLabel(text=f"{os.path.basename(filename)}\n" + (f"Waiting for {queued} earlier report(s)..." if queued else "Starting..."), halign='center')
+        self.progress_bar = ProgressBar(max=1, value=0, size_hint_y=None, height=dp(20))
+        layout.add_widget(self.status_label); layout.add_widget(self.progress_bar)
+        layout.add_widget(StyledButton(text="Hide (keeps running)", on_press=self.dismiss, background_color=(0.5, 0.5, 0.5, 1)))
+        self.content = layout
+    def update_progress(self, page, rows_done, total_rows):
+        self.progress_bar.max, self.progress_bar.value = max(total_rows or rows_done, 1), rows_done
+        self.status_label.text = f"Rendering page {page} ({rows_done}/{total_rows} rows)" if total_rows else f"Rendering page {page} ({rows_done} rows)"
+    def update_batch_progress(self, files_done, total_files):
+        self.progress_bar.max, self.progress_bar.value = max(total_files, 1), files_done
+        self.status_label.text = f"Written {files_done} of {total_files} PDF(s)"
+
+class BatchExportPopup(Popup):
+    def __init__(self, users, **kwargs):
+        super().__init__(**kwargs); self.users = users; self.title = "Batch PDF Export"; self.size_hint = (0.9, 0.6)
+        layout = BoxLayout(orientation='vertical', padding=dp(10), spacing=dp(10)); today = str(datetime.date.today())
+        layout.add_widget(StyledLabel(text=f"Users: {', '.join(users) if users else 'All Users'}", size_hint_y=None, height=dp(44)))
+        from_layout = BoxLayout(size_hint_y=None, height=dp(44), spacing=dp(5)); from_layout.add_widget(StyledLabel(text="From:", size_hint_x=0.3)); self.from_button = StyledButton(text=today[:8] + "01", on_press=lambda x: DatePickerPopup(callback=lambda d: setattr(self.from_button, 'text', d)).open()); from_layout.add_widget(self.from_button); layout.add_widget(from_layout)
+        to_layout = BoxLayout(size_hint_y=None, height=dp(44), spacing=dp(5)); to_layout.add_widget(StyledLabel(text="To:", size_hint_x=0.3)); self.to_button = StyledButton(text=today, on_press=lambda x: DatePickerPopup(callback=lambda d: setattr(self.to_button, 'text', d)).open()); to_layout.add_widget(self.to_button); layout.add_widget(to_layout)
+        self.mode_spinner = Spinner(text='One PDF per user-day', values=['One PDF per user-day', 'Monthly PDF per user'], size_hint_y=None, height=dp(44)); layout.add_widget(self.mode_spinner)
+        action_layout = BoxLayout(size_hint_y=None, height=dp(44), spacing=dp(10)); action_layout.add_widget(StyledButton(text="Export", on_press=self.start_export, background_color=(0, 0.7, 0.2, 1))); action_layout.add_widget(StyledButton(text="Cancel", on_press=self.dismiss, background_color=(0.6, 0.2, 0.2, 1))); layout.add_widget(action_layout)
+        self.content = layout
+    def start_export(self, *a):
+        app, merge = App.get_running_app(), self.mode_spinner.text == 'Monthly PDF per user'
+        out_dir, progress_popup = os.path.join(get_download_path(), "DSR_Exports"), PdfProgressPopup("Batch export")
+        def on_snapshots(snapshots):
+            if not snapshots:
+                progress_popup.dismiss(); app.root.get_screen('admin').show_popup("Batch Export", "No entries in this date range."); return
+            app.reports.submit_batch(snapshots, out_dir, merge=merge, on_progress=progress_popup.update_batch_progress, on_done=on_done, on_error=on_error)
+        def on_done(written): progress_popup.dismiss(); app.root.get_screen('admin').show_popup("Batch Export", f"Wrote {len(written)} PDF(s) to:\n{out_dir}")
+        def on_error(e): progress_popup.dismiss(); app.root.get_screen('admin').show_popup("Batch Export", f"Export failed: {e}")
+        app.io.read(app.store.day_snapshots, self.users or None, self.from_button.text, self.to_button.text, callback=on_snapshots)
+        self.dismiss(); progress_popup.open()
+
+class ExportPopup(Popup):
+    # Streams every entry matching `filters` to a CSV or XLSX file on the report thread; no rows reach the UI.
+    def __init__(self, filters, **kwargs):
+        super().__init__(**kwargs); self.filters = filters; self.title = "Export Spreadsheet"; self.size_hint = (0.9, None); self.height = dp(260)
+        layout = BoxLayout(orientation='vertical', padding=dp(10), spacing=dp(10))
+        self.status_label = StyledLabel(text=", ".join(f"{key.replace('_', ' ').title()}: {value}" for key, value in filters.items() if value) or "All entries", halign='center')
+        layout.add_widget(self.status_label)
+        self.format_layout = BoxLayout(size_hint_y=None, height=dp(44), spacing=dp(10))
+        self.format_layout.add_widget(StyledButton(text="CSV", on_press=lambda x: self.start_export('csv'), background_color=(0, 0.7, 0.2, 1)))
+        self.format_layout.add_widget(StyledButton(text="XLSX" if HAVE_OPENPYXL else "XLSX (needs openpyxl)", disabled=not HAVE_OPENPYXL, on_press=lambda x: self.start_export('xlsx'), background_color=(0.1, 0.5, 0.8, 1)))
+        layout.add_widget(self.format_layout)
+        layout.add_widget(StyledButton(text="Close", on_press=self.dismiss, background_color=(0.5, 0.5, 0.5, 1)))
+        self.content = layout
+    def start_export(self, fmt):
+        filename = os.path.join(get_download_path(), f"DSR_Export_{datetime.datetime.now():%Y%m%d_%H%M%S}.{fmt}")
+        self.format_layout.disabled, self.status_label.text = True, f"Exporting to {os.path.basename(filename)}..."
+        def on_progress(rows): self.status_label.text = f"{os.path.basename(filename)}: {rows} rows written"
+        def on_done(rows): self.status_label.text = f"Wrote {rows} rows to:\n{filename}"
+        def on_error(e): self.status_label.text, self.format_layout.disabled = f"Export failed: {e}", False
+        App.get_running_app().reports.submit_export(DB_FILE, filename, self.filters, on_progress=on_progress, on_done=on_done, on_error=on_error)
+
 class FilterPopup(Popup):
     def __init__(self, ledger_screen_ref, **kwargs):
         super().__init__(**kwargs); self.ledger_screen = ledger_screen_ref; self.title = "Filter Ledger Entries"; self.size_hint = (0.9, 0.7)
@@ -122,18 +200,63 @@ class FilterPopup(Popup):
     def clear_all_filters(self, *a): self.clear_date_filter(); self.party_filter_input.text = ""; self.bill_filter_input.text = ""
     def apply_and_dismiss(self, *a): self.ledger_screen.apply_filters(date=self.date_button.text if "Filter" not in self.date_button.text else None, party=self.party_filter_input.text.strip(), bill=self.bill_filter_input.text.strip()); self.dismiss()
 
+# --- DSR Row Model ---
+class DsrTotals:
+    # Running sums (in paise, so deltas never drift) over every DSR row on screen.
+    KEYS = ('credit', 'payment', 'return', 'discount', 'balance')
+    def __init__(self, on_change=None): self.paise = dict.fromkeys(self.KEYS, 0); self.on_change = on_change
+    def get(self, key): return self.paise[key] / 100
+    def apply(self, deltas):
+        for key, delta in deltas.items(): self.paise[key] += delta
+        if self.on_change: self.on_change(self)
+    def reset(self): self.apply({key: -value for key, value in self.paise.items()})
+
+class DsrRowModel:
+    # Parsed amounts for one row; each field change pushes only its delta into the shared DsrTotals.
+    AMOUNTS = ('credit', 'payment', 'return', 'discount')
+    def __init__(self, totals=None):
+        self.values, self.paise, self.invalid, self.totals = dict.fromkeys(self.AMOUNTS, 0.0), dict.fromkeys(self.AMOUNTS, 0), set(), totals
+    @property
+    def balance(self): v = self.values; return v['credit'] - (v['payment'] + v['return'] + v['discount'])
+    def set_amount(self, field, text):
+        try: value = float(text or 0); self.invalid.discard(field)
+        except ValueError: value = 0.0; self.invalid.add(field)
+        delta = round(value * 100) - self.paise[field]
+        self.values[field], self.paise[field] = value, self.paise[field] + delta
+        if delta and self.totals: self.totals.apply({field: delta, 'balance': delta if field == 'credit' else -delta})
+
+class WidgetPool:
+    # Bounded free-list of detached rows. Released rows are reset and reused most-recent-first;
+    # once more than max_size are idle the least recently released is dropped for the GC.
+    def __init__(self, factory, max_size): self.factory, self.free = factory, deque(maxlen=max_size)
+    def acquire(self): return self.free.pop() if self.free else self.factory()
+    def release(self, widget): widget.reset(); self.free.append(widget)
+
 # --- Main Widgets ---
 class DSRRow(BoxLayout):
-    def __init__(self, **kwargs):
+    def __init__(self, totals=None, **kwargs):
         super().__init__(**kwargs); self.orientation = 'horizontal'; self.size_hint = (None, None); self.height = dp(44); self.spacing = dp(5); self.width = dp(1100)
+        self.entry_id = None  # Stable ID of the saved entry this row edits; assigned on first save
+        self.model = DsrRowModel(totals)
+        self.generation = 0  # Bumped on reset so lookups issued for a previous use of this row are ignored
         self.bill_input = StyledTextInput(size_hint_x=None, width=dp(100)); self.party_input = StyledTextInput(size_hint_x=None, width=dp(250)); self.credit_input = StyledTextInput(size_hint_x=None, width=dp(120))
         self.payment_input = StyledTextInput(size_hint_x=None, width=dp(120)); self.return_input = StyledTextInput(size_hint_x=None, width=dp(120)); self.discount_input = StyledTextInput(size_hint_x=None, width=dp(120))
         self.balance_input = StyledTextInput(readonly=True, size_hint_x=None, width=dp(150))
         for widget in [self.bill_input, self.party_input, self.credit_input, self.payment_input, self.return_input, self.discount_input, self.balance_input]: self.add_widget(widget)
+        # Coalesce keystrokes: every keystroke re-arms the trigger, so the prefill lookup only runs once typing pauses.
+        self.bill_lookup_trigger = Clock.create_trigger(self.lookup_bill, BILL_LOOKUP_DELAY)
         self.bill_input.bind(text=self.on_bill_change)
-        for w in [self.credit_input, self.payment_input, self.return_input, self.discount_input]: w.bind(text=self.update_balance)
-    def on_bill_change(self, i, v):
-        all_data = load_json(DATA_FILE, []); found_data = next((e for e in reversed(all_data) if isinstance(e, dict) and e.get("bill") == v.strip()), None)
+        self.party_suggest_trigger = Clock.create_trigger(self.suggest_parties, BILL_LOOKUP_DELAY)
+        self.party_dropdown = DropDown(); self.party_dropdown.bind(on_select=self.on_party_selected)
+        self.party_input.bind(text=self.on_party_change)
+        for field, w in [('credit', self.credit_input), ('payment', self.payment_input), ('return', self.return_input), ('discount', self.discount_input)]: w.bind(text=partial(self.on_amount_change, field))
+    def on_amount_change(self, field, instance, text): self.model.set_amount(field, text); self.update_balance()
+    def on_bill_change(self, i, v): self.bill_lookup_trigger.cancel(); self.bill_lookup_trigger()
+    def lookup_bill(self, *args):
+        bill, generation = self.bill_input.text.strip(), self.generation
+        get_io().read(get_store().latest_for_bill, bill, callback=lambda found_data: self.apply_bill_prefill(bill, found_data, generation))
+    def apply_bill_prefill(self, bill, found_data, generation):
+        if generation != self.generation or bill != self.bill_input.text.strip(): return  # Typing resumed or the row was recycled
         if found_data:
             self.party_input.text = found_data.get("party", "")
             self.credit_input.text = str(float(found_data.get("balance", 0))) if found_data.get("balance") is not None else ''
@@ -141,12 +264,29 @@ class DSRRow(BoxLayout):
         else:
             self.party_input.text, self.credit_input.text, self.payment_input.text, self.return_input.text, self.discount_input.text = "", "", "", "", ""
         self.update_balance()
+    def on_party_change(self, i, v):
+        # Only while typing, not when a row is loaded or prefilled; re-armed per keystroke so it runs once typing pauses.
+        if self.party_input.focus: self.party_suggest_trigger.cancel(); self.party_suggest_trigger()
+    def suggest_parties(self, *args):
+        text, generation = self.party_input.text.strip(), self.generation
+        get_io().read(get_store().suggest_parties, text, callback=lambda names: self.show_party_suggestions(text, names, generation))
+    def show_party_suggestions(self, text, names, generation):
+        if generation != self.generation or text != self.party_input.text.strip() or not self.party_input.focus or names in ([], [text]):
+            self.party_dropdown.dismiss(); return
+        self.party_dropdown.clear_widgets()
+        for name in names: self.party_dropdown.add_widget(StyledButton(text=name, height=dp(40), background_color=(0.2, 0.2, 0.2, 1), on_release=lambda b: self.party_dropdown.select(b.text)))
+        if self.party_dropdown.attach_to is None: self.party_dropdown.open(self.party_input)
+    def on_party_selected(self, dropdown, name):
+        self.party_input.text = name; self.party_suggest_trigger.cancel()
     def update_balance(self, *args):
-        try:
-            c, p, r, d = float(self.credit_input.text or 0), float(self.payment_input.text or 0), float(self.return_input.text or 0), float(self.discount_input.text or 0)
-            self.balance_input.text = f"{c - (p + r + d):.2f}"
-        except ValueError:
-            self.balance_input.text = "Error"
+        self.balance_input.text = "Error" if self.model.invalid else f"{self.model.balance:.2f}"
+    def attach(self, totals): self.model.totals = totals
+    def reset(self):
+        # Detach from the screen totals first so clearing the fields does not subtract from them.
+        self.model.totals, self.entry_id = None, None
+        self.generation += 1
+        for w in [self.bill_input, self.party_input, self.credit_input, self.payment_input, self.return_input, self.discount_input]: w.text = ""
+        self.bill_lookup_trigger.cancel(); self.party_suggest_trigger.cancel(); self.party_dropdown.dismiss()
 
 class HeaderRow(BoxLayout):
     def __init__(self, **kwargs):
@@ -162,15 +302,38 @@ class NoteRow(BoxLayout):
         self.description_input = StyledTextInput(hint_text="Note Description (e.g., Online, Cheque)")
         self.amount_input = StyledTextInput(hint_text="Amount", size_hint_x=0.4, input_filter='float')
         self.add_widget(self.description_input); self.add_widget(self.amount_input)
+    def reset(self): self.description_input.text, self.amount_input.text = "", ""
+
+LEDGER_COLUMNS = (('bill', 100), ('party', 250), ('credit', 120), ('payment', 120), ('return', 120), ('discount', 120), ('balance', 150))
 
-class LedgerDataRow(BoxLayout):
-    def __init__(self, entry, screen_ref, **kwargs):
+def ledger_view_model(entry):
+    # Pre-formatted cell text, so a recycled LedgerDataRow only assigns strings when it is rebound.
+    model = {key: f"{entry.get(key, 0):.2f}" for key, _ in LEDGER_COLUMNS[2:]}
+    model.update({'entry': entry, 'bill': entry.get('bill', ''), 'party': entry.get('party', '')})
+    return model
+
+class LedgerDataRow(RecycleDataViewBehavior, BoxLayout):
+    def __init__(self, **kwargs):
         super().__init__(**kwargs); self.orientation = 'horizontal'; self.size_hint = (None, None); self.height = dp(44); self.spacing = dp(5); self.width = dp(1250)
-        self.add_widget(StyledLabel(text=entry.get('bill', ''), size_hint_x=None, width=dp(100))); self.add_widget(StyledLabel(text=entry.get('party', ''), size_hint_x=None, width=dp(250)))
-        self.add_widget(StyledLabel(text=f"{entry.get('credit', 0):.2f}", size_hint_x=None, width=dp(120))); self.add_widget(StyledLabel(text=f"{entry.get('payment', 0):.2f}", size_hint_x=None, width=dp(120)))
-        self.add_widget(StyledLabel(text=f"{entry.get('return', 0):.2f}", size_hint_x=None, width=dp(120))); self.add_widget(StyledLabel(text=f"{entry.get('discount', 0):.2f}", size_hint_x=None, width=dp(120)))
-        self.add_widget(StyledLabel(text=f"{entry.get('balance', 0):.2f}", size_hint_x=None, width=dp(150)))
-        self.add_widget(StyledButton(text="Edit", size_hint_x=None, width=dp(120), on_press=lambda x: screen_ref.open_edit_popup(entry)))
+        self.entry, self.screen_ref, self.cells = {}, None, []
+        for key, width in LEDGER_COLUMNS:
+            label = StyledLabel(size_hint_x=None, width=dp(width)); self.add_widget(label); self.cells.append((key, label))
+        self.add_widget(StyledButton(text="Edit", size_hint_x=None, width=dp(120), on_press=lambda x: self.screen_ref.open_edit_popup(self.entry)))
+    def refresh_view_attrs(self, rv, index, data):
+        self.entry, self.screen_ref = data['entry'], rv.ledger_screen
+        for key, label in self.cells: label.text = data[key]
+
+class OutstandingRow(RecycleDataViewBehavior, BoxLayout):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs); self.orientation = 'horizontal'; self.size_hint_y = None; self.height = dp(44); self.spacing = dp(5)
+        self.party, self.screen_ref = None, None
+        self.title_label = StyledLabel(size_hint_x=0.45); self.detail_label = StyledLabel(size_hint_x=0.25); self.amount_label = StyledLabel(size_hint_x=0.2, halign='right')
+        self.bills_button = StyledButton(text="Bills", size_hint_x=0.1, on_press=lambda x: self.screen_ref.show_bills(self.party))
+        for widget in [self.title_label, self.detail_label, self.amount_label, self.bills_button]: self.add_widget(widget)
+    def refresh_view_attrs(self, rv, index, data):
+        self.party, self.screen_ref = data['party'], rv.outstanding_screen
+        self.title_label.text, self.detail_label.text, self.amount_label.text = data['title'], data['detail'], data['amount']
+        self.bills_button.disabled, self.bills_button.opacity = data['party'] is None, 0 if data['party'] is None else 1
 
 class BaseCard(BoxLayout):
     def __init__(self, **kwargs):
@@ -178,22 +341,38 @@ class BaseCard(BoxLayout):
         with self.canvas.before: Color(0.25, 0.25, 0.25, 1); self.rect = RoundedRectangle(size=self.size, pos=self.pos, radius=[dp(10),]); self.bind(pos=self.update_rect, size=self.update_rect)
     def update_rect(self, i, v): self.rect.pos, self.rect.size = i.pos, i.size
     def add_info(self, key, value):
-        info_row = BoxLayout(size_hint_y=None, height=dp(25)); info_row.add_widget(StyledLabel(text=f"{key}:", bold=True, size_hint_x=0.4)); info_row.add_widget(StyledLabel(text=str(value), size_hint_x=0.6, halign='left'))
-        self.add_widget(info_row)
+        info_row = BoxLayout(size_hint_y=None, height=dp(25)); info_row.add_widget(StyledLabel(text=f"{key}:", bold=True, size_hint_x=0.4)); value_label = StyledLabel(text=str(value), size_hint_x=0.6, halign='left'); info_row.add_widget(value_label)
+        self.add_widget(info_row); return value_label
 
-class AdminDataRow(BaseCard):
-    def __init__(self, entry_data, admin_panel_ref, **kwargs):
-        super().__init__(**kwargs)
-        self.add_info("User", entry_data.get('user', 'N/A')); self.add_info("Date", entry_data.get('date', 'N/A'))
-        self.add_info("Bill No", entry_data.get('bill', 'N/A')); self.add_info("Party", entry_data.get('party', 'N/A'))
-        self.add_info("Payment", f"{entry_data.get('payment', 0):.2f}"); self.add_info("Balance", f"{entry_data.get('balance', 0):.2f}")
+class AdminDataRow(RecycleDataViewBehavior, BaseCard):
+    # Recycled view: the RecycleView instantiates only enough cards to fill the screen and rebinds them via refresh_view_attrs.
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs); self.entry_data, self.admin_panel_ref = {}, None
+        self.user_label, self.date_label = self.add_info("User", ''), self.add_info("Date", '')
+        self.bill_label, self.party_label = self.add_info("Bill No", ''), self.add_info("Party", '')
+        self.payment_label, self.balance_label = self.add_info("Payment", ''), self.add_info("Balance", '')
         actions_layout = BoxLayout(size_hint_y=None, height=dp(44), spacing=dp(10))
-        edit_btn = StyledButton(text="Edit", on_press=lambda x: admin_panel_ref.open_edit_popup(entry_data))
-        delete_btn = StyledButton(text="Delete", on_press=lambda x: admin_panel_ref.confirm_action_popup( "Delete DSR Entry", "Are you sure? Enter Admin Password to delete this entry.", lambda: self.delete_entry_confirmed(entry_data, admin_panel_ref)), background_color=(0.8, 0.2, 0.2, 1))
+        edit_btn = StyledButton(text="Edit", on_press=lambda x: self.admin_panel_ref.open_edit_popup(self.entry_data))
+        delete_btn = StyledButton(text="Delete", on_press=self.confirm_delete, background_color=(0.8, 0.2, 0.2, 1))
         actions_layout.add_widget(edit_btn); actions_layout.add_widget(delete_btn); self.add_widget(actions_layout)
+    def refresh_view_attrs(self, rv, index, data):
+        entry_data = self.entry_data = data['entry']; self.admin_panel_ref = rv.admin_panel
+        self.user_label.text, self.date_label.text = str(entry_data.get('user', 'N/A')), str(entry_data.get('date', 'N/A'))
+        self.bill_label.text, self.party_label.text = str(entry_data.get('bill', 'N/A')), str(entry_data.get('party', 'N/A'))
+        self.payment_label.text, self.balance_label.text = f"{entry_data.get('payment', 0):.2f}", f"{entry_data.get('balance', 0):.2f}"
+    def confirm_delete(self, instance):
+        # Capture the entry now; this card may be recycled for another entry while the popup is open.
+        entry_data, admin_panel_ref = self.entry_data, self.admin_panel_ref
+        admin_panel_ref.confirm_action_popup("Delete DSR Entry", "Are you sure? Enter Admin Password to delete this entry.", lambda: self.delete_entry_confirmed(entry_data, admin_panel_ref))
     def delete_entry_confirmed(self, entry_data, admin_panel_ref):
-        all_data = load_json(DATA_FILE, []); updated_data = [entry for entry in all_data if entry != entry_data]; save_json(DATA_FILE, updated_data)
-        admin_panel_ref.show_popup("Success", "DSR Entry deleted successfully."); admin_panel_ref.apply_filters()
+        def on_deleted(deleted):
+            if not deleted:
+                admin_panel_ref.show_popup("Error", "Could not find this entry; archived entries are read-only."); return
+            # Later entries of the bill may have been re-carried from the entry before the deleted one.
+            forget_entries(deleted); admin_panel_ref.show_popup("Success", "DSR Entry deleted successfully.")
+            admin_panel_ref.remove_entry(entry_data['id']); admin_panel_ref.replace_entries(deleted[1:])
+        forget_day(entry_data['user'], entry_data['date'])
+        get_io().write(get_store().delete_entry, entry_data['id'], key=('entry', entry_data['id']), callback=on_deleted)
 
 # --- Screen Classes ---
 class LoginScreen(Screen):
@@ -226,11 +405,13 @@ class LoginScreen(Screen):
     
     def login(self, instance):
         user, pwd = self.username_input.text.strip(), self.password_input.text.strip()
-        users = load_json(USERS_FILE, {})
         if user == ADMIN_USER:
             self.show_popup("Action Not Allowed", "Please use the 'Admin Panel' button for admin login.")
             return
-        if user in users and verify_password(pwd, users.get(user)):
+        get_io().read(get_store().get_password, user, callback=lambda stored_password: self.finish_login(user, pwd, stored_password))
+
+    def finish_login(self, user, pwd, stored_password):
+        if stored_password is not None and verify_password(pwd, stored_password):
             self.manager.app.username, self.manager.app.is_admin = user, False
             self.manager.current = "main"
             self.password_input.text = ""
@@ -257,12 +438,12 @@ class LoginScreen(Screen):
         if user == ADMIN_USER:
             self.show_popup("Error", f"'{ADMIN_USER}' is a reserved username.")
             return
-        users = load_json(USERS_FILE, {})
-        if user in users:
+        get_io().write(get_store().add_user, user, hash_password(pwd), key=('user', user), callback=self.finish_signup)
+
+    def finish_signup(self, added):
+        if not added:
             self.show_popup("Error", "User already exists.")
             return
-        users[user] = hash_password(pwd)
-        save_json(USERS_FILE, users)
         self.show_popup("Success", "Signup successful. You can now login.")
         self.username_input.text, self.password_input.text = "", ""
 
@@ -285,42 +466,116 @@ class AdminPanel(Screen):
         user_layout.add_widget(self.user_spinner)
         filter_box.add_widget(user_layout)
         
+        month_layout = BoxLayout(size_hint_y=None, height=dp(44), spacing=dp(5))
+        month_layout.add_widget(StyledLabel(text="Month:", size_hint_x=0.2))
+        self.month_spinner = Spinner(text='All Months', values=['All Months'], size_hint_y=None, height=dp(44), size_hint_x=0.8)
+        month_layout.add_widget(self.month_spinner)
+        filter_box.add_widget(month_layout)
+        
         action_layout = BoxLayout(size_hint_y=None, height=dp(44), spacing=dp(10))
         action_layout.add_widget(StyledButton(text="Filter Users", on_press=self.apply_filters, background_color=(0, 0.7, 0.2, 1)))
         action_layout.add_widget(StyledButton(text="Manage Users", on_press=self.go_to_user_management, background_color=(0.8, 0.5, 0.1, 1)))
+        action_layout.add_widget(StyledButton(text="Batch PDFs", on_press=self.open_batch_export, background_color=(0.1, 0.7, 0.6, 1)))
+        action_layout.add_widget(StyledButton(text="Export Sheet", on_press=self.open_sheet_export, background_color=(0.1, 0.5, 0.8, 1)))
         filter_box.add_widget(action_layout)
+        report_layout = BoxLayout(size_hint_y=None, height=dp(44), spacing=dp(10))
+        report_layout.add_widget(StyledButton(text="Dashboard", on_press=lambda x: setattr(self.manager, 'current', 'dashboard'), background_color=(0.2, 0.4, 0.8, 1)))
+        report_layout.add_widget(StyledButton(text="Outstanding", on_press=lambda x: open_outstanding(self.manager, 'admin'), background_color=(0.6, 0.3, 0.7, 1)))
+        report_layout.add_widget(StyledButton(text="Archive Old Years", on_press=self.confirm_archive, background_color=(0.5, 0.5, 0.5, 1)))
+        filter_box.add_widget(report_layout)
+        self.collections_label = StyledLabel(text="", size_hint_y=None, height=dp(30), halign='center')
+        filter_box.add_widget(self.collections_label)
         
-        self.scroll = ScrollView()
-        self.grid = GridLayout(cols=1, spacing=dp(10), size_hint_y=None)
-        self.grid.bind(minimum_height=self.grid.setter('height'))
-        self.scroll.add_widget(self.grid)
+        self.empty_label = StyledLabel(text="", size_hint_y=None, height=0, halign='center')
+        self.rv = RecycleView(viewclass=AdminDataRow, bar_width=dp(10))
+        self.rv.admin_panel = self
+        self.rv_layout = RecycleBoxLayout(orientation='vertical', spacing=dp(10), size_hint_y=None, default_size=(None, ADMIN_CARD_HEIGHT), default_size_hint=(1, None))
+        self.rv_layout.bind(minimum_height=self.rv_layout.setter('height'), height=self.on_list_height)
+        self.rv.add_widget(self.rv_layout)
+        self.rv.bind(scroll_y=self.on_list_scroll)
+        self.page_cursor = None  # page_entries cursor (keyset position, or a position in the archives); None once exhausted
+        self.scroll_anchor, self.page_loading, self.page_generation = None, False, 0
         
         layout.add_widget(filter_box)
-        layout.add_widget(self.scroll)
+        layout.add_widget(self.empty_label)
+        layout.add_widget(self.rv)
         layout.add_widget(StyledButton(text="Back to Login", on_press=lambda x: setattr(self.manager, 'current', 'login')))
         self.add_widget(layout)
 
     def on_pre_enter(self, *args):
-        users = list(load_json(USERS_FILE, {}).keys())
+        store = get_store()
+        self.rv.data = []
+        self.set_empty_message("Loading...")
+        # Month choices come from the partition manifest, not from scanning entries.
+        get_io().read(lambda: (list(store.get_users().keys()), store.months()), callback=self.on_filter_choices_loaded)
+
+    def on_filter_choices_loaded(self, choices):
+        users, months = choices
         # Filter out the admin user from the dropdown list for clarity
         self.user_spinner.values = ['All Users'] + [u for u in users if u != ADMIN_USER]
         self.user_spinner.text = 'All Users'
+        self.month_spinner.values = ['All Months'] + months
+        self.month_spinner.text = 'All Months'
         self.apply_filters()
 
     def apply_filters(self, *args):
-        self.grid.clear_widgets()
-        all_data = load_json(DATA_FILE, [])
-        filtered_data = [e for e in all_data if isinstance(e, dict)]
-        if self.user_spinner.text != 'All Users':
-            filtered_data = [e for e in filtered_data if e.get('user') == self.user_spinner.text]
-        
-        filtered_data.sort(key=lambda x: (x.get('date', ''), x.get('user', '')), reverse=True)
-        
-        if not filtered_data:
-            self.grid.add_widget(StyledLabel(text="No entries found for this user.", size_hint_y=None, height=dp(40), halign='center'))
-        else:
-            for entry in filtered_data:
-                self.grid.add_widget(AdminDataRow(entry_data=entry, admin_panel_ref=self))
+        self.page_cursor, self.page_loading = None, False
+        self.page_generation += 1  # Pages still in flight for the previous filters are dropped on arrival
+        self.rv.data = []
+        self.rv.scroll_y = 1
+        self.load_next_page(first=True)
+        self.load_collections()
+
+    def load_collections(self):
+        user = self.user_spinner.text if self.user_spinner.text != 'All Users' else None
+        month = self.month_spinner.text if self.month_spinner.text != 'All Months' else None
+        date_from, date_to = month_bounds(month) if month else ("0000-00-00", "9999-99-99")
+        generation, store = self.page_generation, get_store()
+        get_io().read(lambda: store.notes_total(date_from, date_to, user), callback=lambda total: self.show_collections(generation, total, user, month))
+
+    def show_collections(self, generation, total, user, month):
+        if generation != self.page_generation: return
+        self.collections_label.text = f"Other Collections ({user or 'All Users'}, {month or 'All Months'}): {total:.2f}"
+
+    def load_next_page(self, first=False):
+        if self.page_loading or (not first and self.page_cursor is None): return
+        self.page_loading = True
+        if first: self.set_empty_message("Loading...")
+        user = self.user_spinner.text if self.user_spinner.text != 'All Users' else None
+        month = self.month_spinner.text if self.month_spinner.text != 'All Months' else None
+        after, generation, store = self.page_cursor, self.page_generation, get_store()
+        get_io().read(lambda: store.page_entries(user=user, month=month, after=after, limit=ADMIN_PAGE_SIZE), callback=lambda page: self.on_page_loaded(generation, page))
+
+    def on_page_loaded(self, generation, page):
+        if generation != self.page_generation: return
+        entries, self.page_cursor = page
+        self.page_loading = False
+        if self.rv.data: self.scroll_anchor = (1 - self.rv.scroll_y) * max(self.rv_layout.height - self.rv.height, 0)
+        self.rv.data.extend({'entry': e} for e in entries)
+        self.set_empty_message("No entries found for this user." if not self.rv.data else "")
+
+    def on_list_scroll(self, rv, scroll_y):
+        # Fetch the next page once the user scrolls into the last screenful of loaded cards.
+        if self.page_cursor is not None and rv.height and scroll_y * max(self.rv_layout.height - rv.height, 0) < rv.height:
+            self.load_next_page()
+
+    def on_list_height(self, layout, height):
+        # Keep the cards under the finger in place when a page is appended below them.
+        if self.scroll_anchor is not None:
+            self.rv.scroll_y, self.scroll_anchor = max(0, 1 - self.scroll_anchor / max(height - self.rv.height, 1)), None
+
+    def set_empty_message(self, text):
+        self.empty_label.text, self.empty_label.height = text, dp(40) if text else 0
+
+    def replace_entries(self, entries):
+        by_id = {entry['id']: entry for entry in entries}
+        for item in self.rv.data:
+            if (entry := by_id.get(item['entry'].get('id'))) is not None: item['entry'] = entry
+        self.rv.refresh_from_data()
+
+    def remove_entry(self, entry_id):
+        self.rv.data = [item for item in self.rv.data if item['entry'].get('id') != entry_id]
+        self.set_empty_message("No entries found for this user." if not self.rv.data else "")
 
     def show_popup(self, title, msg):
         Popup(title=title, content=StyledLabel(text=msg, halign='center', valign='middle'), size_hint=(0.8, None), height=dp(150)).open()
@@ -356,22 +611,39 @@ class AdminPanel(Screen):
     def go_to_user_management(self, instance):
         self.manager.current = 'user_management'
 
+    def confirm_archive(self, instance):
+        today = datetime.date.today()
+        cutoff = f"{(today.year if today.month >= 4 else today.year - 1) - ARCHIVE_KEEP_YEARS + 1}-04-01"
+        def on_archived(moved):
+            self.show_popup("Archived", f"Moved {moved} entries dated before {cutoff} into compressed yearly archives.")
+            self.on_pre_enter()
+        def perform_archive(): get_io().write_alone(get_store().archive_before, cutoff, callback=on_archived, error_callback=lambda e: self.show_popup("Archive Error", f"Could not archive: {e}"))
+        self.confirm_action_popup("Archive Old Years", f"Move entries dated before {cutoff} into read-only yearly archives? Enter Admin Password.", perform_archive)
+
+    def open_batch_export(self, instance):
+        BatchExportPopup(users=[self.user_spinner.text] if self.user_spinner.text != 'All Users' else []).open()
+
+    def open_sheet_export(self, instance):
+        month = self.month_spinner.text if self.month_spinner.text != 'All Months' else None
+        # Real first and last days rather than month_bounds' "-00"/"-99" keys, since the popup shows them.
+        date_from, date_to = (f"{month}-01", f"{month}-{calendar.monthrange(int(month[:4]), int(month[5:]))[1]:02d}") if month else (None, None)
+        ExportPopup({'user': self.user_spinner.text if self.user_spinner.text != 'All Users' else None, 'date_from': date_from, 'date_to': date_to}).open()
+
     def open_edit_popup(self, entry_data):
         popup = EditDsrPopup(entry_data=entry_data, save_callback=self.save_edited_entry_with_confirmation)
         popup.open()
 
     def save_edited_entry_with_confirmation(self, original_entry, updated_entry):
-        def perform_save():
-            all_data = load_json(DATA_FILE, [])
-            try:
-                # Find the index of the original entry and replace it
-                index = all_data.index(original_entry)
-                all_data[index] = updated_entry
-                save_json(DATA_FILE, all_data)
+        def on_saved(updated):
+            if updated:
+                forget_entries(updated)
                 self.show_popup("Success", "Entry updated successfully.")
-                self.apply_filters()
-            except ValueError:
+                self.replace_entries(updated)
+            else:
                 self.show_popup("Error", "Could not find the original entry to update.")
+        def perform_save():
+            forget_day(original_entry['user'], original_entry['date'])
+            get_io().write(get_store().update_entry, original_entry['id'], updated_entry, key=('entry', original_entry['id']), callback=on_saved)
         
         self.confirm_action_popup("Confirm Edit", "Enter Admin Password to save changes.", perform_save)
 
@@ -398,8 +670,10 @@ class UserManagementPanel(Screen):
     def on_pre_enter(self, *args): self.refresh_user_list()
 
     def refresh_user_list(self):
+        get_io().read(get_store().get_users, callback=self.show_user_list)
+
+    def show_user_list(self, users):
         self.user_grid.clear_widgets()
-        users = load_json(USERS_FILE, {})
         user_list = [u for u in sorted(users.keys()) if u != ADMIN_USER]
         for username in user_list:
             self.user_grid.add_widget(UserRow(username, self))
@@ -424,17 +698,17 @@ class UserRow(GridLayout):
         self.add_widget(actions_layout)
 
     def delete_user(self, instance):
-        def confirmed_callback():
-            users = load_json(USERS_FILE, {})
-            if self.username in users:
-                del users[self.username]
-            save_json(USERS_FILE, users)
+        def on_deleted(result):
             self.panel.show_popup("Success", f"User '{self.username}' deleted.")
             self.panel.refresh_user_list()
+        def confirmed_callback(): get_io().write(get_store().delete_user, self.username, key=('user', self.username), callback=on_deleted)
         
         self.panel.confirm_action_popup("Confirm Deletion", f"Delete user '{self.username}'?", confirmed_callback)
         
 class MainScreen(Screen):
+    loading_key = None  # (user, date) whose entries are being read in the background
+    reports_queued = 0  # PDFs submitted to the report thread but not finished yet
+
     def on_pre_enter(self, *args):
         if not self.children:
             self.setup_ui()
@@ -468,7 +742,9 @@ class MainScreen(Screen):
         main_content.add_widget(dsr_section)
         
         self.rows = []
+        self.row_pool = WidgetPool(DSRRow, DSR_ROW_POOL_SIZE)
         self.total_label = StyledLabel(text="Total Payment: 0.00", size_hint_y=None, height=dp(30), font_size='16sp', halign='right')
+        self.totals = DsrTotals(on_change=self.update_total_label)
         main_content.add_widget(self.total_label)
         
         # Notes Section
@@ -479,6 +755,7 @@ class MainScreen(Screen):
         notes_scroll.add_widget(self.notes_grid)
         main_content.add_widget(notes_scroll)
         self.notes = []
+        self.note_pool = WidgetPool(NoteRow, NOTE_ROW_POOL_SIZE)
 
         main_scroll.add_widget(main_content)
         layout.add_widget(main_scroll)
@@ -493,6 +770,7 @@ class MainScreen(Screen):
         self.btns_layout.add_widget(StyledButton(text="Add Note", on_press=lambda x: self.add_note_row()))
         self.btns_layout.add_widget(StyledButton(text="Save & PDF", on_press=self.save_and_generate_pdf, background_color=(0, 0.7, 0.2, 1)))
         self.btns_layout.add_widget(StyledButton(text="View Ledger", on_press=lambda x: setattr(self.manager, 'current', 'user_ledger'), background_color=(0.8, 0.5, 0.1, 1)))
+        self.btns_layout.add_widget(StyledButton(text="Outstanding", on_press=lambda x: open_outstanding(self.manager, 'main'), background_color=(0.6, 0.3, 0.7, 1)))
         
         footer.add_widget(self.prepared_by_label)
         footer.add_widget(self.btns_layout)
@@ -506,25 +784,48 @@ class MainScreen(Screen):
         if hasattr(self, 'btns_layout'):
             # Landscape mode (width > height) gets more columns for buttons
             if width > height:
-                self.btns_layout.cols = 4 # All 4 buttons in one row
+                self.btns_layout.cols = 5 # All 5 buttons in one row
             else: # Portrait mode
-                self.btns_layout.cols = 2 # 2x2 grid for buttons
+                self.btns_layout.cols = 2 # Two-column grid for buttons
                 
     def load_data_for_date(self, selected_date):
         self.clear_screen()
         app = App.get_running_app()
-        self.prepared_by_label.text = f"DSR Report prepared by {app.username}"
-        all_data = load_json(DATA_FILE, [])
-        user_data_for_date = [e for e in all_data if isinstance(e, dict) and e.get('user') == app.username and e.get('date') == selected_date]
+        key = self.loading_key = (app.username, selected_date)
+        if (day := app.day_cache.get(key)) is not None:
+            self.on_day_loaded(key, *day)
+        else:
+            self.prepared_by_label.text = f"Loading entries for {selected_date}..."
+            self.read_day(key, callback=lambda day: self.on_day_loaded(key, *day))
+        self.prefetch_neighbours(key)
+
+    def read_day(self, key, callback=None):
+        # Fills the day cache on the way back; a save that lands in between bumps the version and the result is dropped.
+        cache, store = App.get_running_app().day_cache, get_store()
+        version = cache.version(key)
+        def on_read(day):
+            cache.put(key, day, version)
+            if callback: callback(day)
+        get_io().read(lambda: (store.entries_for_day(*key), store.notes_for_day(*key)), callback=on_read)
+
+    def prefetch_neighbours(self, key):
+        user, date = key
+        try: day = datetime.date.fromisoformat(date)
+        except ValueError: return
+        for step in (-1, 1):
+            neighbour = (user, str(day + datetime.timedelta(days=step)))
+            if neighbour not in App.get_running_app().day_cache: self.read_day(neighbour)
+
+    def on_day_loaded(self, key, user_data_for_date, user_notes_for_date):
+        if key != self.loading_key: return  # The user has already moved to another date
+        self.loading_key = None
+        self.prepared_by_label.text = f"DSR Report prepared by {key[0]}"
         if user_data_for_date:
             for entry in user_data_for_date:
                 self.add_row(data=entry)
         else:
             self.add_row()
             
-        all_notes = load_json(NOTES_FILE, {})
-        notes_key = f"{app.username}_{selected_date}"
-        user_notes_for_date = all_notes.get(notes_key, [])
         if user_notes_for_date:
             for note in user_notes_for_date:
                 self.add_note_row(data=note)
@@ -532,23 +833,23 @@ class MainScreen(Screen):
             self.add_note_row()
 
     def add_row(self, data=None):
-        row = DSRRow()
+        row = self.row_pool.acquire()
+        row.attach(self.totals)
         if data:
+            row.entry_id = data.get('id')
             row.bill_input.text = data.get('bill', '')
             row.party_input.text = data.get('party', '')
             row.credit_input.text = str(float(data.get('credit', 0)))
             row.payment_input.text = str(float(data.get('payment', 0)))
             row.return_input.text = str(float(data.get('return', 0)))
             row.discount_input.text = str(float(data.get('discount', 0)))
+            row.bill_lookup_trigger.cancel()  # Saved values win over the bill's carried-forward prefill
             row.update_balance()
         self.grid.add_widget(row)
         self.rows.append(row)
-        # Bind payment input to update the total label
-        row.payment_input.bind(text=self.calculate_total)
-        self.calculate_total()
 
     def add_note_row(self, data=None):
-        note_row = NoteRow()
+        note_row = self.note_pool.acquire()
         if data:
             # **FIXED**: Using 'description' key consistently.
             note_row.description_input.text = data.get('description', '')
@@ -557,24 +858,25 @@ class MainScreen(Screen):
         self.notes.append(note_row)
     
     def save_and_generate_pdf(self, instance):
+        if self.loading_key is not None:
+            self.show_popup("Please Wait", "Entries for this date are still loading.")
+            return
         app, entry_date = App.get_running_app(), self.date_input.text.strip()
         new_entries, new_notes = [], []
         
         for row in self.rows:
             if bill := row.bill_input.text.strip():
-                try:
-                    new_entries.append({
-                        "user": app.username, "date": entry_date, "bill": bill,
-                        "party": row.party_input.text.strip(),
-                        "credit": float(row.credit_input.text or 0),
-                        "payment": float(row.payment_input.text or 0),
-                        "return": float(row.return_input.text or 0),
-                        "discount": float(row.discount_input.text or 0),
-                        "balance": float(row.balance_input.text or 0)
-                    })
-                except ValueError:
+                # Amounts come from the row model, already parsed as they were typed.
+                if row.model.invalid:
                     self.show_popup("Save Error", f"Row for bill {bill} has an invalid number.")
                     return
+                row.entry_id = row.entry_id or new_entry_id()
+                new_entries.append({
+                    "id": row.entry_id, "user": app.username, "date": entry_date, "bill": bill,
+                    "party": row.party_input.text.strip(),
+                    **row.model.values,
+                    "balance": round(row.model.balance, 2)
+                })
         
         for note_row in self.notes:
             if desc := note_row.description_input.text.strip():
@@ -585,104 +887,32 @@ class MainScreen(Screen):
                     self.show_popup("Save Error", f"Note '{desc}' has an invalid amount.")
                     return
         
-        all_data = load_json(DATA_FILE, [])
-        other_data = [e for e in all_data if not (isinstance(e,dict) and e.get('user') == app.username and e.get('date') == entry_date)]
-        save_json(DATA_FILE, other_data + new_entries)
-        
-        all_notes = load_json(NOTES_FILE, {})
-        all_notes[f"{app.username}_{entry_date}"] = new_notes
-        save_json(NOTES_FILE, all_notes)
+        # Replaces only this user's rows and notes for the day; repeated saves of the same day coalesce into one commit.
+        day_cache = app.day_cache
+        day_cache.invalidate((app.username, entry_date))
+        day_cache.put((app.username, entry_date), ([Entry.from_mapping(e) for e in new_entries], [dict(n) for n in new_notes]))
+        get_io().write(get_store().replace_day, app.username, entry_date, new_entries, new_notes, key=('day', app.username, entry_date), callback=forget_entries, error_callback=lambda e: self.on_save_failed(app.username, entry_date, e))
         
         self.generate_pdf(new_entries, new_notes, app.username, entry_date)
         # No need to reload data, as PDF generation is the final step for the user.
         # self.load_data_for_date(entry_date)
 
+    def on_save_failed(self, user, date, error):
+        forget_day(user, date)
+        self.show_popup("Save Error", f"Could not save entries: {error}")
+
     def generate_pdf(self, entries, notes, username, date):
         path = get_download_path()
         filename = os.path.join(path, f"DSR_{username}_{date}.pdf")
-        try:
-            c = canvas.Canvas(filename, pagesize=A4)
-            width, height = A4
-            margin = 1.5 * cm
-            top_margin = height - margin
-            line_height = 0.6 * cm
-            y = top_margin
-            
-            c.setFont("Helvetica-Bold", 16)
-            c.drawCentredString(width / 2.0, y, f"DAILY SALES REPORT - {date}")
-            y -= line_height * 2
-            
-            x_pos = {"bill": margin, "party": margin + 2.5*cm, "credit": margin + 7.5*cm, "payment": margin + 10*cm, "return": margin + 12.5*cm, "discount": margin + 15*cm, "balance": margin + 17.5*cm}
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(x_pos["bill"], y, "Bill No")
-            c.drawString(x_pos["party"], y, "Party Name")
-            c.drawRightString(x_pos["credit"] + 1.5*cm, y, "Credit") # Adjust for right alignment
-            c.drawRightString(x_pos["payment"] + 1.5*cm, y, "Payment")
-            c.drawRightString(x_pos["return"] + 1.5*cm, y, "Return")
-            c.drawRightString(x_pos["discount"] + 1.5*cm, y, "Discount")
-            c.drawRightString(x_pos["balance"] + 1.5*cm, y, "Balance")
-            
-            y -= line_height * 0.25
-            c.line(margin, y, width - margin, y)
-            y -= line_height
-            
-            c.setFont("Helvetica", 9)
-            totals = {'payment': 0, 'return': 0, 'discount': 0}
-            
-            for entry in entries:
-                if y < margin + 2*cm:
-                    c.showPage()
-                    c.setFont("Helvetica", 9)
-                    y = top_margin
-                
-                c.drawString(x_pos["bill"], y, entry.get('bill', ''))
-                c.drawString(x_pos["party"], y, entry.get('party', ''))
-                c.drawRightString(x_pos["credit"] + 1.5*cm, y, f"{entry.get('credit', 0):.2f}")
-                c.drawRightString(x_pos["payment"] + 1.5*cm, y, f"{entry.get('payment', 0):.2f}")
-                c.drawRightString(x_pos["return"] + 1.5*cm, y, f"{entry.get('return', 0):.2f}")
-                c.drawRightString(x_pos["discount"] + 1.5*cm, y, f"{entry.get('discount', 0):.2f}")
-                c.drawRightString(x_pos["balance"] + 1.5*cm, y, f"{entry.get('balance', 0):.2f}")
-                
-                for key in totals:
-                    totals[key] += entry.get(key, 0)
-                y -= line_height
-            
-            y -= line_height * 0.25
-            c.line(margin, y, width - margin, y)
-            y -= line_height
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(x_pos["party"], y, "Totals:")
-            c.drawRightString(x_pos["payment"] + 1.5*cm, y, f"{totals['payment']:.2f}")
-            c.drawRightString(x_pos["return"] + 1.5*cm, y, f"{totals['return']:.2f}")
-            c.drawRightString(x_pos["discount"] + 1.5*cm, y, f"{totals['discount']:.2f}")
-            
-            total_notes_amount = 0
-            if notes:
-                y -= line_height * 2
-                c.setFont("Helvetica-Bold", 12)
-                c.drawString(margin, y, "Other Collections / Notes:")
-                y -= line_height
-                c.setFont("Helvetica", 10)
-                for note in notes:
-                    # **FIXED**: Using 'description' key.
-                    c.drawString(margin + 0.5*cm, y, f"- {note.get('description', '')}:")
-                    amount = note.get('amount', 0)
-                    c.drawRightString(x_pos["payment"] + 1.5*cm, y, f"{amount:.2f}")
-                    total_notes_amount += amount
-                    y -= line_height
-            
-            y -= line_height
-            c.line(margin, y, width - margin, y)
-            y -= line_height
-            c.setFont("Helvetica-Bold", 11)
-            c.drawRightString(x_pos["payment"] + 1.5*cm, y, f"Grand Total: {totals['payment'] + total_notes_amount:.2f}")
-            
-            c.setFont("Helvetica-Oblique", 9)
-            c.drawCentredString(width/2.0, margin / 2, f"Report Prepared By: {username}")
-            c.save()
-            self.show_info_popup(f"PDF saved successfully to:\n{filename}")
-        except Exception as e:
-            self.show_popup("PDF Error", f"Could not generate PDF: {e}")
+        # Rendered from a plain snapshot on the report thread, so data entry stays usable meanwhile.
+        progress_popup = PdfProgressPopup(filename, queued=self.reports_queued)
+        self.reports_queued += 1
+        def on_done(f):
+            self.reports_queued -= 1; progress_popup.dismiss(); self.show_info_popup(f"PDF saved successfully to:\n{f}")
+        def on_error(e):
+            self.reports_queued -= 1; progress_popup.dismiss(); self.show_popup("PDF Error", f"Could not generate PDF: {e}")
+        App.get_running_app().reports.submit(filename, [dict(e) for e in entries], [dict(n) for n in notes], username, date, on_progress=progress_popup.update_progress, on_done=on_done, on_error=on_error)
+        progress_popup.open()
 
     def show_info_popup(self, message):
         Popup(title="Success", content=StyledLabel(text=message, halign='center'), size_hint=(0.9, None), height=dp(250)).open()
@@ -691,16 +921,18 @@ class MainScreen(Screen):
         if hasattr(self, 'grid'):
             self.grid.clear_widgets()
             self.notes_grid.clear_widgets()
+            # Rows go back to the pools for the next date instead of being rebuilt.
+            for row in self.rows: self.row_pool.release(row)
+            for note_row in self.notes: self.note_pool.release(note_row)
             self.rows.clear()
             self.notes.clear()
-        self.calculate_total()
+            self.totals.reset()
         
     def open_date_picker(self, i): DatePickerPopup(callback=self.on_date_selected).open()
     def on_date_selected(self, d): self.date_input.text = d; self.load_data_for_date(d)
     
-    def calculate_total(self, *a):
-        total = sum(float(r.payment_input.text or 0) for r in self.rows if r.payment_input.text.strip())
-        self.total_label.text = f"Total Payment: {total:.2f}"
+    def update_total_label(self, totals):
+        self.total_label.text = f"Total Payment: {totals.get('payment'):.2f}"
 
     def show_popup(self, t, m):
         Popup(title=t, content=StyledLabel(text=m, halign='center', valign='middle'), size_hint=(0.9, None), height=dp(200)).open()
@@ -710,71 +942,248 @@ class MainScreen(Screen):
         self.manager.current = 'login'
         self.show_popup("Logged Out", "You have been successfully logged out.")
 
+class OutstandingScreen(Screen):
+    back_to = 'main'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        layout = BoxLayout(orientation='vertical', padding=dp(10), spacing=dp(10))
+        self.title_label = StyledLabel(text="Outstanding by Party", font_size='20sp', size_hint_y=None, height=dp(40), halign='center')
+        self.total_label = StyledLabel(text="", size_hint_y=None, height=dp(30), halign='center')
+        self.parties_button = StyledButton(text="All Parties", on_press=lambda x: self.show_parties(), background_color=(0.1, 0.7, 0.6, 1), disabled=True)
+        layout.add_widget(self.title_label); layout.add_widget(self.total_label); layout.add_widget(self.parties_button)
+        self.empty_label = StyledLabel(text="", size_hint_y=None, height=0, halign='center')
+        layout.add_widget(self.empty_label)
+        self.rv = RecycleView(viewclass=OutstandingRow, bar_width=dp(10))
+        self.rv.outstanding_screen = self
+        rv_layout = RecycleBoxLayout(orientation='vertical', spacing=dp(5), size_hint_y=None, default_size=(None, dp(44)), default_size_hint=(1, None))
+        rv_layout.bind(minimum_height=rv_layout.setter('height'))
+        self.rv.add_widget(rv_layout)
+        self.view_generation = 0
+        layout.add_widget(self.rv)
+        layout.add_widget(StyledButton(text="Back", on_press=lambda x: setattr(self.manager, 'current', self.back_to), background_color=(0.5, 0.5, 0.5, 1)))
+        self.add_widget(layout)
+
+    def on_pre_enter(self, *a): self.show_parties()
+
+    def show_parties(self):
+        # Reads the materialized party totals, so this costs the same however long the history is.
+        self.title_label.text, self.parties_button.disabled = "Outstanding by Party", True
+        self.load(get_store().party_balances, lambda p: {'party': p['party'], 'title': p['party'] or "(no party)", 'detail': f"{p['bills']} bills", 'amount': f"{p['balance']:.2f}"})
+
+    def show_bills(self, party):
+        self.title_label.text, self.parties_button.disabled = f"Outstanding for {party or '(no party)'}", False
+        self.load(partial(get_store().bill_balances, party), lambda b: {'party': None, 'title': f"Bill {b['bill']}", 'detail': f"{b['date']} ({b['user']})", 'amount': f"{b['balance']:.2f}"})
+
+    def load(self, read, view_model):
+        self.view_generation += 1
+        generation = self.view_generation
+        self.rv.data, self.total_label.text = [], ""
+        self.empty_label.text, self.empty_label.height = "Loading...", dp(50)
+        get_io().read(read, callback=lambda rows: self.show_rows(generation, rows, view_model))
+
+    def show_rows(self, generation, rows, view_model):
+        if generation != self.view_generation: return
+        self.rv.data = [view_model(r) for r in rows]
+        self.total_label.text = f"Total Outstanding: {sum(r['balance'] for r in rows):.2f}"
+        self.empty_label.text, self.empty_label.height = ("Nothing outstanding.", dp(50)) if not rows else ("", 0)
+
+DASHBOARD_RANGES = {'Last 7 Days': (7, 'day'), 'Last 30 Days': (30, 'day'), 'Last 12 Months': (12, 'month')}
+
+def dashboard_range(name, today):
+    count, group = DASHBOARD_RANGES[name]
+    if group == 'day': return str(today - datetime.timedelta(days=count - 1)), str(today), group
+    month_index = today.year * 12 + today.month - count  # first month of the window, zero-based
+    return f"{month_index // 12}-{month_index % 12 + 1:02d}-01", str(today), group
+
+class TrendBar(Widget):
+    def __init__(self, fraction, **kwargs):
+        super().__init__(**kwargs); self.fraction = fraction
+        with self.canvas: Color(0.1, 0.7, 0.6, 1); self.rect = Rectangle(pos=self.pos, size=(0, 0))
+        self.bind(pos=self.update_rect, size=self.update_rect)
+    def update_rect(self, *a): self.rect.pos, self.rect.size = (self.x, self.y + dp(8)), (self.width * self.fraction, max(self.height - dp(16), 0))
+
+class AdminDashboard(Screen):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        layout = BoxLayout(orientation='vertical', padding=dp(10), spacing=dp(10))
+        layout.add_widget(StyledLabel(text="Collections Dashboard", font_size='20sp', size_hint_y=None, height=dp(40), halign='center'))
+        self.range_spinner = Spinner(text='Last 7 Days', values=list(DASHBOARD_RANGES), size_hint_y=None, height=dp(44))
+        self.range_spinner.bind(text=lambda i, v: self.load())
+        layout.add_widget(self.range_spinner)
+        # The summary groups every entry in the range on numpy columns; without numpy the button stays disabled.
+        layout.add_widget(StyledButton(text="Summary PDF" if HAVE_NUMPY else "Summary PDF (needs numpy)", disabled=not HAVE_NUMPY, on_press=self.export_summary, background_color=(0.1, 0.7, 0.6, 1)))
+        scroll = ScrollView()
+        self.grid = GridLayout(cols=1, spacing=dp(5), size_hint_y=None)
+        self.grid.bind(minimum_height=self.grid.setter('height'))
+        scroll.add_widget(self.grid)
+        layout.add_widget(scroll)
+        layout.add_widget(StyledButton(text="Back to Admin Panel", on_press=lambda x: setattr(self.manager, 'current', 'admin'), background_color=(0.5, 0.5, 0.5, 1)))
+        self.add_widget(layout)
+        self.load_generation = 0
+
+    def on_pre_enter(self, *a): self.load()
+
+    def load(self):
+        # Aggregates the per-day rollup rows; no entry is read to draw the dashboard.
+        self.load_generation += 1
+        generation, store = self.load_generation, get_store()
+        date_from, date_to, group = dashboard_range(self.range_spinner.text, datetime.date.today())
+        self.grid.clear_widgets(); self.grid.add_widget(StyledLabel(text="Loading...", size_hint_y=None, height=dp(40), halign='center'))
+        get_io().read(lambda: (store.rollup_totals(date_from, date_to, 'user'), store.rollup_totals(date_from, date_to, group)), callback=lambda totals: self.show_totals(generation, *totals))
+
+    def export_summary(self, instance):
+        date_from, date_to, _ = dashboard_range(self.range_spinner.text, datetime.date.today())
+        filename = os.path.join(get_download_path(), f"Summary_{date_from}_{date_to}.pdf")
+        popup = Popup(title="Generating Summary", content=StyledLabel(text="Building the summary report...", halign='center'), size_hint=(0.8, None), height=dp(150), auto_dismiss=False)
+        def on_done(f): popup.dismiss(); self.manager.get_screen('admin').show_popup("Success", f"Summary saved to:\n{f}")
+        def on_error(e): popup.dismiss(); self.manager.get_screen('admin').show_popup("PDF Error", f"Could not generate summary: {e}")
+        App.get_running_app().reports.submit_summary(DB_FILE, filename, App.get_running_app().username, date_from, date_to, on_done=on_done, on_error=on_error)
+        popup.open()
+
+    def add_line(self, *cells, bold=False):
+        line = BoxLayout(size_hint_y=None, height=dp(36), spacing=dp(5))
+        for text in cells: line.add_widget(StyledLabel(text=text, bold=bold))
+        self.grid.add_widget(line)
+
+    def show_totals(self, generation, by_user, by_period):
+        if generation != self.load_generation: return
+        self.grid.clear_widgets()
+        if not by_period:
+            self.grid.add_widget(StyledLabel(text="No entries in this range.", size_hint_y=None, height=dp(40), halign='center')); return
+        self.grid.add_widget(StyledLabel(text="Per Salesman", font_size='18sp', size_hint_y=None, height=dp(40)))
+        self.add_line("User", "Entries", "Payment", "Notes", "Collected", bold=True)
+        for t in by_user: self.add_line(t['key'], str(t['entries']), f"{t['payment']:.2f}", f"{t['notes']:.2f}", f"{t['payment'] + t['notes']:.2f}")
+        self.add_line("All", str(sum(t['entries'] for t in by_user)), f"{sum(t['payment'] for t in by_user):.2f}", f"{sum(t['notes'] for t in by_user):.2f}", f"{sum(t['payment'] + t['notes'] for t in by_user):.2f}", bold=True)
+        self.grid.add_widget(StyledLabel(text="Collections Trend", font_size='18sp', size_hint_y=None, height=dp(40)))
+        peak = max([t['payment'] + t['notes'] for t in by_period] + [0]) or 1
+        for t in by_period:
+            collected = t['payment'] + t['notes']
+            line = BoxLayout(size_hint_y=None, height=dp(36), spacing=dp(5))
+            line.add_widget(StyledLabel(text=t['key'], size_hint_x=0.25)); line.add_widget(TrendBar(max(collected, 0) / peak, size_hint_x=0.5)); line.add_widget(StyledLabel(text=f"{collected:.2f}", size_hint_x=0.25))
+            self.grid.add_widget(line)
+
+def open_outstanding(manager, back_to):
+    manager.get_screen('outstanding').back_to = back_to
+    manager.current = 'outstanding'
+
 class UserLedgerScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._last_filters = {}
         layout = BoxLayout(orientation='vertical', padding=dp(10), spacing=dp(10))
         layout.add_widget(StyledLabel(text="My Ledger / History", font_size='20sp', size_hint_y=None, height=dp(40), halign='center'))
-        layout.add_widget(StyledButton(text="Filter Ledger", on_press=self.open_filter_popup, background_color=(0.1, 0.7, 0.6, 1)))
+        ledger_actions = BoxLayout(size_hint_y=None, height=dp(44), spacing=dp(10))
+        ledger_actions.add_widget(StyledButton(text="Filter Ledger", on_press=self.open_filter_popup, background_color=(0.1, 0.7, 0.6, 1)))
+        ledger_actions.add_widget(StyledButton(text="Export Sheet", on_press=self.open_sheet_export, background_color=(0.1, 0.5, 0.8, 1)))
+        layout.add_widget(ledger_actions)
         
         ledger_header = HeaderRow()
         ledger_header.width = dp(1250)
         ledger_header.add_widget(StyledLabel(text="Edit Action", size_hint_x=None, width=dp(120)))
         layout.add_widget(ledger_header)
         
-        scroll_view = ScrollView(size_hint=(1, 1), do_scroll_x=True, do_scroll_y=True, bar_width=dp(10))
-        self.grid = GridLayout(cols=1, spacing=dp(10), size_hint=(None, None), width=dp(1250))
-        self.grid.bind(minimum_height=self.grid.setter('height'))
-        scroll_view.add_widget(self.grid)
-        layout.add_widget(scroll_view)
+        self.empty_label = StyledLabel(text="", size_hint_y=None, height=0)
+        layout.add_widget(self.empty_label)
+        self.totals_label = StyledLabel(text="", size_hint_y=None, height=dp(30))
+        layout.add_widget(self.totals_label)
+        self.rv = RecycleView(viewclass=LedgerDataRow, do_scroll_x=True, do_scroll_y=True, bar_width=dp(10))
+        self.rv.ledger_screen = self
+        rv_layout = RecycleBoxLayout(orientation='vertical', spacing=dp(10), size_hint=(None, None), width=dp(1250), default_size=(dp(1250), dp(44)), default_size_hint=(None, None))
+        rv_layout.bind(minimum_height=rv_layout.setter('height'))
+        self.rv.add_widget(rv_layout)
+        self.row_index = {}  # entry id -> position in self.rv.data
+        self.filter_generation, self.collection_totals = 0, None
+        layout.add_widget(self.rv)
         
         layout.add_widget(StyledButton(text="Back to Daily Entry", on_press=lambda x: setattr(self.manager, 'current', 'main'), background_color=(0.5,0.5,0.5,1)))
         self.add_widget(layout)
         
     def on_pre_enter(self, *a): self.apply_filters()
     def open_filter_popup(self, *a): FilterPopup(ledger_screen_ref=self).open()
+    def open_sheet_export(self, *a):
+        f = self._last_filters
+        ExportPopup({'user': App.get_running_app().username, 'date_from': f.get('date'), 'date_to': f.get('date'), 'party': f.get('party'), 'bill': f.get('bill')}).open()
     
     def apply_filters(self, date=None, party=None, bill=None):
         self._last_filters = {'date': date, 'party': party, 'bill': bill}
-        self.grid.clear_widgets()
         app = App.get_running_app()
         current_user = app.username
-        all_data = load_json(DATA_FILE, [])
-        user_data = [e for e in all_data if isinstance(e, dict) and e.get('user') == current_user]
-        
-        if date: user_data = [e for e in user_data if e.get('date') == date]
-        if party: user_data = [e for e in user_data if party.lower() in e.get('party', '').lower()]
-        if bill: user_data = [e for e in user_data if bill == e.get('bill', '')]
-        
-        user_data.sort(key=lambda x: (x.get('date', ''), x.get('bill','')), reverse=True)
-        
-        if not user_data:
-            self.grid.add_widget(StyledLabel(text="No entries found for these filters.", height=dp(50), size_hint=(None, None), width=dp(1150)))
-        else:
-            for entry in user_data:
-                self.grid.add_widget(LedgerDataRow(entry, self))
+        self.filter_generation += 1
+        generation, store = self.filter_generation, get_store()
+        self.empty_label.text, self.empty_label.height = "Loading...", dp(50)
+        filters = self._last_filters
+        get_io().read(lambda: (store.find_entries(user=current_user, date=date, party=party, bill=bill, order_by=('date', 'bill')), self.read_collection_totals(store, current_user, filters)), callback=lambda result: self.show_entries(generation, *result))
+
+    def read_collection_totals(self, store, user, f):
+        # (payments, other collections) over the same user and dates, both from the daily rollups so archived years
+        # count on both sides. Notes aren't tied to a party or bill, so with those filters there is no combined total.
+        if f.get('party') or f.get('bill'): return None
+        date_from, date_to = (f['date'], f['date']) if f.get('date') else ("0000-00-00", "9999-99-99")
+        rollup = store.rollup_totals(date_from, date_to, 'user', user)
+        return (rollup[0]['payment'] if rollup else 0), store.notes_total(date_from, date_to, user)
+
+    def show_entries(self, generation, user_data, collection_totals=None):
+        if generation != self.filter_generation: return
+        self.collection_totals = collection_totals
+        # Swapping the view-model list rebinds the existing row widgets; none are rebuilt.
+        self.rv.data = [ledger_view_model(entry) for entry in user_data]
+        self.row_index = {entry['id']: i for i, entry in enumerate(user_data)}
+        self.empty_label.text, self.empty_label.height = ("No entries found for these filters.", dp(50)) if not user_data else ("", 0)
+        self.show_totals()
+
+    def show_totals(self):
+        if self.collection_totals is None:
+            payments = sum(item['entry']['payment'] for item in self.rv.data)
+            self.totals_label.text = f"Payments (filtered rows): {payments:.2f}"
+            return
+        payments, other = self.collection_totals
+        self.totals_label.text = f"Payments: {payments:.2f}   Other Collections: {other:.2f}   Collected: {payments + other:.2f}"
+
+    def refresh_totals(self):
+        generation, store, user, filters = self.filter_generation, get_store(), App.get_running_app().username, self._last_filters
+        get_io().read(lambda: self.read_collection_totals(store, user, filters), callback=lambda totals: self.on_totals_refreshed(generation, totals))
+
+    def on_totals_refreshed(self, generation, totals):
+        if generation != self.filter_generation: return
+        self.collection_totals = totals
+        self.show_totals()
 
     def open_edit_popup(self, d):
         popup = EditDsrPopup(entry_data=d, save_callback=self.save_edited_entry)
         popup.open()
 
     def save_edited_entry(self, o, u):
-        all_data = load_json(DATA_FILE, [])
-        try:
-            index = all_data.index(o)
-            all_data[index] = u
-            save_json(DATA_FILE, all_data)
+        forget_day(o['user'], o['date'])
+        get_io().write(get_store().update_entry, o['id'], u, key=('entry', o['id']), callback=self.on_entry_saved)
+
+    def on_entry_saved(self, updated):
+        if updated:
+            forget_entries(updated)
             # Use the consistent popup method from AdminPanel
             self.manager.get_screen('admin').show_popup("Success", "Entry updated successfully.")
-            self.apply_filters(**self._last_filters)
-        except ValueError:
+            # The edited entry plus any later entries of its bill whose carried-forward credit was recomputed.
+            for entry in updated: self.update_row(entry['id'], entry)
+            if self.collection_totals is None: self.show_totals()
+            else: self.refresh_totals()
+        else:
             self.manager.get_screen('admin').show_popup("Error", "Could not find original entry.")
+
+    def update_row(self, entry_id, entry):
+        if (index := self.row_index.get(entry_id)) is not None: self.rv.data[index] = ledger_view_model(entry)
         
 # --- App Class ---
 class BusinessApp(App):
     def build(self):
         self.username, self.is_admin = "", False
+        self.store = ArchivedStore(DB_FILE)
+        if os.path.exists(SNAPSHOT_FILE): migrated, source = self.store.migrate(partial(load_legacy, SNAPSHOT_FILE, USERS_FILE)), SNAPSHOT_FILE
+        else: migrated, source = self.store.migrate_from_json(DATA_FILE, NOTES_FILE, USERS_FILE), f"{DATA_FILE}, {NOTES_FILE}"
+        if migrated: print(f"Migrated {source} and {USERS_FILE} into {DB_FILE}.")
+        # From here on the database is only touched from the I/O worker thread.
+        self.io = IOWorker(self.store, deliver=deliver_on_main_thread)
+        self.reports = ReportQueue(deliver=deliver_on_main_thread)
+        self.day_cache = DayCache()
         self.sm = ScreenManager()
         self.sm.app = self  # Make app instance accessible from screens
         
@@ -783,6 +1192,8 @@ class BusinessApp(App):
         self.sm.add_widget(AdminPanel(name="admin"))
         self.sm.add_widget(UserManagementPanel(name="user_management"))
         self.sm.add_widget(UserLedgerScreen(name="user_ledger"))
+        self.sm.add_widget(OutstandingScreen(name="outstanding"))
+        self.sm.add_widget(AdminDashboard(name="dashboard"))
         
         return self.sm
 
@@ -795,11 +1206,15 @@ class BusinessApp(App):
                 print(f"Could not request permissions: {e}")
         
         # Ensure the admin user exists in the user file
-        users_data = load_json(USERS_FILE, {})
-        if ADMIN_USER not in users_data:
-            users_data[ADMIN_USER] = hash_password(ADMIN_PASS)
-            save_json(USERS_FILE, users_data)
-            print(f"Default admin user '{ADMIN_USER}' created/verified in {USERS_FILE}.")
+        self.io.write(self.store.add_user, ADMIN_USER, hash_password(ADMIN_PASS), key=('user', ADMIN_USER), callback=self.on_admin_user_checked)
+
+    def on_admin_user_checked(self, created):
+        if created: print(f"Default admin user '{ADMIN_USER}' created/verified in {DB_FILE}.")
+
+    def on_stop(self):
+        self.io.stop()  # Commits any writes still waiting to be grouped
+        self.reports.shutdown()
+        self.store.close()
 
 if __name__ == '__main__':
     BusinessApp().run()
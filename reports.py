@@ -0,0 +1,354 @@
+import argparse
+import datetime
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# PDF Generation Library
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+
+from archive import ArchivedStore
+from columns import EntryColumns
+from exports import export_from_db
+
+# --- DSR PDF Rendering ---
+# Kept free of Kivy so reports can be rendered off the UI thread from a plain snapshot of the day.
+TOTAL_KEYS = ("payment", "return", "discount")
+PAGE_TEMPLATE = "dsr_page"
+ENTRY_LABELS = ("Bill No", "Party Name")
+
+class ReportWriter:
+    # Streams rows onto A4 pages. The static column header and footer are drawn once as a form XObject
+    # and stamped on every page; each full page ends with its subtotal and the total carried forward.
+    def __init__(self, c, username, progress=None, total_rows=None, labels=ENTRY_LABELS):
+        self.c, self.progress, self.total_rows, self.username = c, progress, total_rows, username
+        self.width, self.height = A4
+        self.margin = 1.5 * cm
+        self.top_margin = self.height - self.margin
+        self.line_height = 0.6 * cm
+        m = self.margin
+        self.x_pos = {"bill": m, "party": m + 2.5*cm, "credit": m + 7.5*cm, "payment": m + 10*cm, "return": m + 12.5*cm, "discount": m + 15*cm, "balance": m + 17.5*cm}
+        self.page, self.rows_done, self.title, self.y = 0, 0, "", self.top_margin
+        self.page_totals, self.carried = dict.fromkeys(TOTAL_KEYS, 0), dict.fromkeys(TOTAL_KEYS, 0)
+        self.templates = set()
+        self._use_template(labels)
+
+    def _use_template(self, labels):
+        # One form per distinct pair of leading column labels, defined the first time a section asks for it.
+        self.template = f"{PAGE_TEMPLATE}:{'|'.join(labels)}"
+        if self.template not in self.templates:
+            self._define_template(labels)
+            self.templates.add(self.template)
+
+    def _define_template(self, labels):
+        c, x_pos, y = self.c, self.x_pos, self.top_margin - self.line_height * 2
+        c.beginForm(self.template)
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(x_pos["bill"], y, labels[0])
+        c.drawString(x_pos["party"], y, labels[1])
+        for key, label in (("credit", "Credit"), ("payment", "Payment"), ("return", "Return"), ("discount", "Discount"), ("balance", "Balance")):
+            c.drawRightString(x_pos[key] + 1.5*cm, y, label) # Adjust for right alignment
+        y -= self.line_height * 0.25
+        c.line(self.margin, y, self.width - self.margin, y)
+        c.setFont("Helvetica-Oblique", 9)
+        c.drawCentredString(self.width/2.0, self.margin / 2, f"Report Prepared By: {self.username}")
+        c.endForm()
+
+    def begin_section(self, title, labels=None):
+        # A new report (e.g. one day of a merged monthly PDF) starts on a fresh page with zeroed totals.
+        self.carried = dict.fromkeys(TOTAL_KEYS, 0)
+        if labels is not None: self._use_template(labels)
+        self._start_page(title)
+
+    def _start_page(self, title=None):
+        if self.page: self.c.showPage()
+        self.page += 1
+        if title is not None: self.title = title
+        c = self.c
+        c.doForm(self.template)
+        c.setFont("Helvetica-Bold", 16)
+        c.drawCentredString(self.width / 2.0, self.top_margin, self.title)
+        c.setFont("Helvetica", 8)
+        c.drawRightString(self.width - self.margin, self.margin / 2, f"Page {self.page}")
+        self.y = self.top_margin - self.line_height * 3.25
+        self.page_totals = dict.fromkeys(TOTAL_KEYS, 0)
+
+    def _ensure_room(self, lines=1, carry=False):
+        if self.y - (lines - 1) * self.line_height >= self.margin + 2*cm: return
+        if carry:
+            self._rule()
+            self._totals_line("Page Total:", self.page_totals)
+            self._totals_line("Carried Forward:", self.carried)
+        if self.progress: self.progress(self.page, self.rows_done, self.total_rows)
+        self._start_page()
+        if carry: self._totals_line("Brought Forward:", self.carried)
+
+    def _rule(self):
+        self.y -= self.line_height * 0.25
+        self.c.line(self.margin, self.y, self.width - self.margin, self.y)
+        self.y -= self.line_height
+
+    def _totals_line(self, label, totals):
+        c, x_pos = self.c, self.x_pos
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(x_pos["party"], self.y, label)
+        for key in TOTAL_KEYS: c.drawRightString(x_pos[key] + 1.5*cm, self.y, f"{totals[key]:.2f}")
+        self.y -= self.line_height
+
+    def heading(self, text):
+        self._ensure_room(2, carry=True)
+        self.c.setFont("Helvetica-Bold", 10)
+        self.c.drawString(self.x_pos["bill"], self.y, text)
+        self.y -= self.line_height
+
+    def row(self, entry):
+        self._ensure_room(carry=True)
+        c, x_pos, y = self.c, self.x_pos, self.y
+        c.setFont("Helvetica", 9)
+        c.drawString(x_pos["bill"], y, entry.get('bill', ''))
+        c.drawString(x_pos["party"], y, entry.get('party', ''))
+        for key in ("credit", "payment", "return", "discount", "balance"):
+            c.drawRightString(x_pos[key] + 1.5*cm, y, f"{entry.get(key, 0):.2f}")
+        for key in TOTAL_KEYS:
+            value = entry.get(key, 0)
+            self.page_totals[key] += value
+            self.carried[key] += value
+        self.rows_done += 1
+        self.y -= self.line_height
+
+    def totals(self):
+        self._ensure_room(3)
+        self._rule()
+        self._totals_line("Totals:", self.carried)
+        return dict(self.carried)
+
+    def notes(self, notes):
+        total_notes_amount = 0
+        if notes:
+            self._ensure_room(4)
+            self.y -= self.line_height
+            self.c.setFont("Helvetica-Bold", 12)
+            self.c.drawString(self.margin, self.y, "Other Collections / Notes:")
+            self.y -= self.line_height
+            for note in notes:
+                self._ensure_room()
+                self.c.setFont("Helvetica", 10)
+                # **FIXED**: Using 'description' key.
+                self.c.drawString(self.margin + 0.5*cm, self.y, f"- {note.get('description', '')}:")
+                amount = note.get('amount', 0)
+                self.c.drawRightString(self.x_pos["payment"] + 1.5*cm, self.y, f"{amount:.2f}")
+                total_notes_amount += amount
+                self.y -= self.line_height
+        return total_notes_amount
+
+    def grand_total(self, amount):
+        self._ensure_room(3)
+        self.y -= self.line_height
+        self.c.line(self.margin, self.y, self.width - self.margin, self.y)
+        self.y -= self.line_height
+        self.c.setFont("Helvetica-Bold", 11)
+        self.c.drawRightString(self.x_pos["payment"] + 1.5*cm, self.y, f"Grand Total: {amount:.2f}")
+
+    def finish(self):
+        if self.progress: self.progress(self.page, self.rows_done, self.total_rows)
+
+def _draw_day(writer, entries, notes, date):
+    writer.begin_section(f"DAILY SALES REPORT - {date}")
+    for entry in entries: writer.row(entry)
+    totals = writer.totals()
+    writer.grand_total(totals['payment'] + writer.notes(notes))
+
+def render_dsr_pdf(filename, entries, notes, username, date, progress=None):
+    # entries may be any iterable; progress(page, rows_done, total_rows) is called as each page is finished.
+    c = canvas.Canvas(filename, pagesize=A4)
+    writer = ReportWriter(c, username, progress, total_rows=len(entries) if hasattr(entries, '__len__') else None)
+    _draw_day(writer, entries, notes, date)
+    c.save()
+    writer.finish()
+    return filename
+
+def render_user_month_pdf(filename, days, username):
+    # One merged report: each (date, entries, notes) day starts on a fresh page with the daily layout.
+    c = canvas.Canvas(filename, pagesize=A4)
+    writer = ReportWriter(c, username)
+    for date, entries, notes in days: _draw_day(writer, entries, notes, date)
+    c.save()
+    return filename
+
+def render_ledger_pdf(filename, entries, username, title, progress=None):
+    # Long date-range ledger; entries is consumed lazily (e.g. EntryStore.iter_entries) so memory stays flat.
+    c = canvas.Canvas(filename, pagesize=A4)
+    writer = ReportWriter(c, username, progress)
+    writer.begin_section(title)
+    current_date = None
+    for entry in entries:
+        if entry.get('date') != current_date:
+            current_date = entry.get('date')
+            writer.heading(current_date)
+        writer.row(entry)
+    totals = writer.totals()
+    writer.grand_total(totals['payment'])
+    c.save()
+    writer.finish()
+    return filename
+
+def render_ledger_from_db(db_path, filename, username, date_from, date_to):
+    # Process-pool job: opens its own connection and streams the user's entries straight into the PDF.
+    store = ArchivedStore(db_path, read_only=True)
+    try: return render_ledger_pdf(filename, store.iter_entries(username, date_from, date_to), username, f"LEDGER - {username} - {date_from} to {date_to}")
+    finally: store.close()
+
+def _net(sums): return dict(sums, balance=sums['credit'] - (sums['payment'] + sums['return'] + sums['discount']))
+
+def render_summary_pdf(filename, columns, username, date_from, date_to, notes=()):
+    # Range-wide totals per salesman and month, then per party, all grouped on the columnar snapshot.
+    # notes: per-salesman other collections as {"description", "amount"}, added to the first grand total.
+    c = canvas.Canvas(filename, pagesize=A4)
+    writer = ReportWriter(c, username, labels=("Entries", "Month"))
+    writer.begin_section(f"SUMMARY - {date_from} to {date_to}")
+    current_user = None
+    for (user, month), sums in columns.group_sum(("user", "month")):
+        if user != current_user:
+            current_user = user
+            writer.heading(user)
+        writer.row({'bill': str(sums['entries']), 'party': month, **_net(sums)})
+    writer.grand_total(writer.totals()['payment'] + writer.notes(notes))
+    writer.begin_section(f"PARTIES - {date_from} to {date_to}", labels=("Entries", "Party Name"))
+    for (party,), sums in sorted(columns.group_sum(("party",)), key=lambda g: -g[1]['payment']):
+        writer.row({'bill': str(sums['entries']), 'party': party, **_net(sums)})
+    writer.grand_total(writer.totals()['payment'])
+    c.save()
+    return filename
+
+def render_summary_from_db(db_path, filename, username, date_from, date_to, users=None):
+    # Own connection, so it can run on the report thread while the app keeps using its store.
+    store = ArchivedStore(db_path, read_only=True)
+    try:
+        users = users or store.entry_users()
+        columns = EntryColumns(itertools.chain.from_iterable(store.iter_entries(user, date_from, date_to) for user in users))
+        notes = [{'description': user, 'amount': amount} for user in users if (amount := store.notes_total(date_from, date_to, user))]
+    finally: store.close()
+    return render_summary_pdf(filename, columns, username, date_from, date_to, notes)
+
+# --- Batch Export ---
+def _make_pool(workers, processes):
+    # processes=True only from a script without a UI (main below); see ReportQueue.submit_batch.
+    workers = workers or os.cpu_count() or 1
+    if processes:
+        try: return ProcessPoolExecutor(max_workers=workers)
+        except (ImportError, NotImplementedError, OSError): pass  # e.g. no working sem_open on Android
+    return ThreadPoolExecutor(max_workers=workers)
+
+def export_pdfs(snapshots, out_dir, merge=False, workers=None, processes=True, on_file=None):
+    # snapshots: (user, date, entries, notes) tuples ordered by user then date, as from EntryStore.day_snapshots.
+    # Writes one PDF per user-day, or with merge=True one per user per month; on_file(filename, done, total) after each.
+    os.makedirs(out_dir, exist_ok=True)
+    if merge:
+        jobs = [(render_user_month_pdf, os.path.join(out_dir, f"DSR_{user}_{month}.pdf"), [(d, e, n) for _, d, e, n in days], user)
+                for (user, month), days in ((k, list(g)) for k, g in itertools.groupby(snapshots, key=lambda s: (s[0], s[1][:7])))]
+    else:
+        jobs = [(render_dsr_pdf, os.path.join(out_dir, f"DSR_{user}_{date}.pdf"), entries, notes, user, date) for user, date, entries, notes in snapshots]
+    return _run_jobs(jobs, workers, processes, on_file)
+
+def export_ledgers(db_path, users, date_from, date_to, out_dir, workers=None, processes=True, on_file=None):
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(render_ledger_from_db, db_path, os.path.join(out_dir, f"Ledger_{user}_{date_from}_{date_to}.pdf"), user, date_from, date_to) for user in users]
+    return _run_jobs(jobs, workers, processes, on_file)
+
+def _run_jobs(jobs, workers, processes, on_file):
+    written = []
+    with _make_pool(workers, processes) as pool:
+        for future in as_completed([pool.submit(*job) for job in jobs]):
+            written.append(future.result())
+            if on_file: on_file(written[-1], len(written), len(jobs))
+    return sorted(written)
+
+def main(argv=None):
+    # Headless entry point (e.g. from cron): python reports.py --from 2024-04-01 --to 2024-04-30 --merge
+    parser = argparse.ArgumentParser(description="Batch export DSR PDFs without starting the app.")
+    parser.add_argument("--db", default="dsr.db", help="database file (default: dsr.db)")
+    parser.add_argument("--users", help="comma-separated usernames (default: all users)")
+    parser.add_argument("--from", dest="date_from", required=True, help="first date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", default=str(datetime.date.today()), help="last date, YYYY-MM-DD (default: today)")
+    parser.add_argument("--out", default="exports", help="output directory (default: exports)")
+    parser.add_argument("--merge", action="store_true", help="write one monthly PDF per user instead of one per user-day")
+    parser.add_argument("--ledger", action="store_true", help="write one streamed ledger PDF per user for the whole range")
+    parser.add_argument("--summary", action="store_true", help="write one summary PDF of totals per user, month and party (needs numpy)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    users = args.users.split(",") if args.users else None
+    if args.summary:
+        os.makedirs(args.out, exist_ok=True)
+        filename = render_summary_from_db(args.db, os.path.join(args.out, f"Summary_{args.date_from}_{args.date_to}.pdf"), "Admin", args.date_from, args.date_to, users)
+        print(f"Wrote {filename}")
+        return 0
+    store = ArchivedStore(args.db, read_only=True)
+    try:
+        if args.ledger: users = users or store.entry_users()
+        else: snapshots = store.day_snapshots(users, args.date_from, args.date_to)
+    finally: store.close()
+    if args.ledger: written = export_ledgers(args.db, users, args.date_from, args.date_to, args.out, workers=args.workers)
+    else: written = export_pdfs(snapshots, args.out, merge=args.merge, workers=args.workers)
+    print(f"Wrote {len(written)} PDF(s) to {args.out}")
+    return 0
+
+class ReportQueue:
+    # Renders submitted reports one at a time on a background thread, so several can queue up;
+    # callbacks are handed back through `deliver` (Clock.schedule_once in the app).
+    def __init__(self, deliver):
+        self.deliver = deliver
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dsr-pdf")
+
+    def submit(self, filename, entries, notes, username, date, on_progress=None, on_done=None, on_error=None):
+        def job():
+            progress = (lambda *p: self.deliver(on_progress, *p)) if on_progress else None
+            try: render_dsr_pdf(filename, entries, notes, username, date, progress)
+            except Exception as e:
+                if on_error: self.deliver(on_error, e)
+                else: print(f"Could not generate PDF: {e}")
+                return
+            if on_done: self.deliver(on_done, filename)
+        return self.executor.submit(job)
+
+    def submit_batch(self, snapshots, out_dir, merge=False, processes=False, on_progress=None, on_done=None, on_error=None):
+        # Threads by default: spawned worker processes (Windows, macOS) re-import the app's main module, which would
+        # start Kivy and open a window per worker. The process pool is for the headless CLI.
+        def job():
+            on_file = (lambda f, done, total: self.deliver(on_progress, done, total)) if on_progress else None
+            try: written = export_pdfs(snapshots, out_dir, merge=merge, processes=processes, on_file=on_file)
+            except Exception as e:
+                if on_error: self.deliver(on_error, e)
+                else: print(f"Batch export failed: {e}")
+                return
+            if on_done: self.deliver(on_done, written)
+        return self.executor.submit(job)
+
+    def submit_summary(self, db_path, filename, username, date_from, date_to, on_done=None, on_error=None):
+        def job():
+            try: render_summary_from_db(db_path, filename, username, date_from, date_to)
+            except Exception as e:
+                if on_error: self.deliver(on_error, e)
+                else: print(f"Could not generate summary: {e}")
+                return
+            if on_done: self.deliver(on_done, filename)
+        return self.executor.submit(job)
+
+    def submit_export(self, db_path, filename, filters, on_progress=None, on_done=None, on_error=None):
+        # filters: export_from_db keywords (user, date_from, date_to, party, bill); on_done(rows written).
+        def job():
+            progress = (lambda rows: self.deliver(on_progress, rows)) if on_progress else None
+            try: count = export_from_db(db_path, filename, progress=progress, **filters)
+            except Exception as e:
+                if on_error: self.deliver(on_error, e)
+                else: print(f"Export failed: {e}")
+                return
+            if on_done: self.deliver(on_done, count)
+        return self.executor.submit(job)
+
+    def shutdown(self): self.executor.shutdown(wait=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
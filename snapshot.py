@@ -0,0 +1,161 @@
+import argparse
+import bisect
+import json
+import mmap
+import struct
+import sys
+
+from storage import AMOUNT_FIELDS, ENTRY_COLUMNS, Entry, EntryStore, load_json, to_paise
+
+# --- Binary DSR snapshot ---
+# A compact alternative to the indented data.json / notes.json pair. Every string (ids, users, dates, bills,
+# parties, note text) is stored once in a string table; entries and notes are fixed-width records of string
+# indices and integer paise, sorted by date, with a date index on top. Readers mmap the file and decode only the
+# records of the dates they ask for.
+#
+#   header | string offsets (u32 * (n+1)) | string bytes (utf-8) | date index | entry records | note records
+MAGIC, VERSION = b"DSRS", 1
+HEADER = struct.Struct("<4sHH4I4Q")      # magic, version, reserved, strings, dates, entries, notes, 4 section offsets
+DATE_RECORD = struct.Struct("<5I")       # date, first entry, entry count, first note, note count
+ENTRY_RECORD = struct.Struct("<5I5q")    # id, user, date, bill, party string indices; credit..balance in paise
+NOTE_RECORD = struct.Struct("<3Iq")      # user, date, description string indices; amount in paise
+
+def write_snapshot(path, entries, notes):
+    with open(path, "wb") as f: f.write(snapshot_bytes(entries, notes))
+
+def snapshot_bytes(entries, notes):
+    # entries: mappings in the stored entry layout; notes: (user, date, {"description", "amount"}) triples.
+    strings, index = [], {}
+    def intern(text):
+        text = str(text or "")
+        if text not in index: index[text] = len(strings); strings.append(text)
+        return index[text]
+    entries = sorted(entries, key=lambda e: e.get('date', ''))
+    notes = sorted(notes, key=lambda n: n[1])
+    entry_records = [ENTRY_RECORD.pack(*(intern(e.get(f)) for f in ENTRY_COLUMNS[:5]), *(to_paise(e.get(f)) for f in AMOUNT_FIELDS)) for e in entries]
+    note_records = [NOTE_RECORD.pack(intern(user), intern(date), intern(n.get('description')), to_paise(n.get('amount'))) for user, date, n in notes]
+    entry_dates, note_dates = [e.get('date', '') for e in entries], [n[1] for n in notes]
+    date_records = []
+    for date in sorted(set(entry_dates) | set(note_dates)):
+        first_entry, first_note = bisect.bisect_left(entry_dates, date), bisect.bisect_left(note_dates, date)
+        date_records.append(DATE_RECORD.pack(intern(date), first_entry, bisect.bisect_right(entry_dates, date) - first_entry, first_note, bisect.bisect_right(note_dates, date) - first_note))
+    blobs = [s.encode("utf-8") for s in strings]
+    offsets, position = [0], 0
+    for blob in blobs: position += len(blob); offsets.append(position)
+    strings_at = HEADER.size
+    dates_at = strings_at + 4 * len(offsets) + position
+    entries_at = dates_at + DATE_RECORD.size * len(date_records)
+    notes_at = entries_at + ENTRY_RECORD.size * len(entry_records)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(strings), len(date_records), len(entry_records), len(note_records), strings_at, dates_at, entries_at, notes_at)
+    return b"".join([header, struct.pack(f"<{len(offsets)}I", *offsets)] + blobs + date_records + entry_records + note_records)
+
+class Snapshot:
+    # Reads a snapshot file through mmap, or an in-memory copy (e.g. a decompressed archive) given as `data`.
+    def __init__(self, path=None, data=None):
+        if data is not None: self.buf = data
+        else:
+            with open(path, "rb") as f: self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.string_count, self.date_count, self.entry_count, self.note_count, self.strings_at, self.dates_at, self.entries_at, self.notes_at = HEADER.unpack_from(self.buf)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path or 'data'} is not a version {VERSION} DSR snapshot")
+        self.text_at = self.strings_at + 4 * (self.string_count + 1)
+        self._strings = {}
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap): self.buf.close()
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    def _string(self, i):
+        if (text := self._strings.get(i)) is None:
+            start, end = struct.unpack_from("<2I", self.buf, self.strings_at + 4 * i)
+            text = self._strings[i] = self.buf[self.text_at + start:self.text_at + end].decode("utf-8")
+        return text
+
+    def _date_record(self, i): return DATE_RECORD.unpack_from(self.buf, self.dates_at + DATE_RECORD.size * i)
+
+    def _date_position(self, date, after=False):
+        # Binary search over the sorted date index (first date >= `date`, or > with after=True); only the probed
+        # dates' strings are decoded.
+        lo, hi = 0, self.date_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = self._string(self._date_record(mid)[0])
+            if probe < date or (after and probe == date): lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def days_between(self, date_from, date_to, user=None, reverse=False):
+        # (date, entries, notes) for every stored date in the inclusive range, optionally for one user.
+        positions = range(self._date_position(date_from), self._date_position(date_to, after=True))
+        for i in reversed(positions) if reverse else positions:
+            record = self._date_record(i)
+            date = self._string(record[0])
+            entries = [e for e in (self._entry(j) for j in range(record[1], record[1] + record[2])) if user is None or e.user == user]
+            notes = [note for u, _, note in (self._note(j) for j in range(record[3], record[3] + record[4])) if user is None or u == user]
+            if entries or notes: yield date, entries, notes
+
+    def _entry(self, i):
+        fields = ENTRY_RECORD.unpack_from(self.buf, self.entries_at + ENTRY_RECORD.size * i)
+        return Entry(*(self._string(s) for s in fields[:5]), *(p / 100 for p in fields[5:]))
+
+    def _note(self, i):
+        user, date, description, paise = NOTE_RECORD.unpack_from(self.buf, self.notes_at + NOTE_RECORD.size * i)
+        return self._string(user), self._string(date), {'description': self._string(description), 'amount': paise / 100}
+
+    def iter_entries(self):
+        for i in range(self.entry_count): yield self._entry(i)
+
+    def iter_notes(self):
+        for i in range(self.note_count): yield self._note(i)
+
+    def legacy_data(self):
+        # The (entry list, {"<user>_<date>": [notes]}) pair data.json and notes.json hold.
+        notes = {}
+        for user, date, note in self.iter_notes(): notes.setdefault(f"{user}_{date}", []).append(note)
+        return [dict(e) for e in self.iter_entries()], notes
+
+# --- Converters ---
+def json_to_snapshot(data_file, notes_file, path):
+    notes = []
+    for key, day_notes in load_json(notes_file, {}).items():
+        user, _, date = key.rpartition("_")  # legacy keys are f"{username}_{date}"
+        notes.extend((user, date, n) for n in day_notes if isinstance(n, dict))
+    write_snapshot(path, [e for e in load_json(data_file, []) if isinstance(e, dict)], notes)
+
+def load_legacy(path, users_file):
+    # Loader for EntryStore.migrate: entries and notes from the snapshot, users still from users.json.
+    with Snapshot(path) as snapshot: return snapshot.legacy_data() + (load_json(users_file, {}),)
+
+def snapshot_to_json(path, data_file, notes_file):
+    with Snapshot(path) as snapshot: entries, notes = snapshot.legacy_data()
+    for e in entries:
+        if not e['id']: del e['id']  # entries converted from pre-ID JSON had none
+    for name, data in ((data_file, entries), (notes_file, notes)):
+        with open(name, "w") as f: json.dump(data, f, indent=4)
+
+def db_to_snapshot(db_path, path):
+    store = EntryStore(db_path, read_only=True)
+    try:
+        days = store.day_snapshots(sorted(set(store.get_users()) | set(store.entry_users())), "0000-00-00", "9999-99-99")
+        write_snapshot(path, [e for _, _, entries, _ in days for e in entries], [(user, date, n) for user, date, _, notes in days for n in notes])
+    finally: store.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert DSR data between JSON, the database and the binary snapshot format.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_binary = commands.add_parser("to-binary", help="data.json + notes.json -> snapshot")
+    to_binary.add_argument("data_file"); to_binary.add_argument("notes_file"); to_binary.add_argument("snapshot")
+    to_json = commands.add_parser("to-json", help="snapshot -> data.json + notes.json")
+    to_json.add_argument("snapshot"); to_json.add_argument("data_file"); to_json.add_argument("notes_file")
+    from_db = commands.add_parser("from-db", help="database -> snapshot")
+    from_db.add_argument("db"); from_db.add_argument("snapshot")
+    args = parser.parse_args(argv)
+    if args.command == "to-binary": json_to_snapshot(args.data_file, args.notes_file, args.snapshot)
+    elif args.command == "to-json": snapshot_to_json(args.snapshot, args.data_file, args.notes_file)
+    else: db_to_snapshot(args.db, args.snapshot)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,697 @@
+import bisect
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping
+
+# --- SQLite Entry Store ---
+# Replaces the flat data.json / notes.json / users.json files with indexed tables.
+ENTRY_FIELDS = ("user", "date", "bill", "party", "credit", "payment", "return", "discount", "balance")
+AMOUNT_FIELDS = ("credit", "payment", "return", "discount", "balance")
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024  # fold the write-ahead journal into the main file past this size
+PARTY_SUGGESTIONS = 8
+PARTY_IN_LIMIT = 500  # beyond this many matching spellings a party filter falls back to a LIKE scan
+ROLLUP_GROUPS = {"user": "user", "day": "date", "month": "substr(date, 1, 7)"}
+ROLLUP_SUMS = ("entries", "credit", "payment", "return", "discount", "notes")
+DAY_CACHE_SIZE = 14  # (user, date) days kept in memory for quick back/forward steps
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT, user TEXT NOT NULL, date TEXT NOT NULL, bill TEXT NOT NULL, party TEXT NOT NULL DEFAULT '',
+    credit REAL NOT NULL DEFAULT 0, payment REAL NOT NULL DEFAULT 0, "return" REAL NOT NULL DEFAULT 0,
+    discount REAL NOT NULL DEFAULT 0, balance REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_entries_user_date ON entries(user, date);
+CREATE INDEX IF NOT EXISTS idx_entries_date_user ON entries(date, user);
+CREATE INDEX IF NOT EXISTS idx_entries_bill ON entries(bill);
+CREATE INDEX IF NOT EXISTS idx_entries_party ON entries(party);
+CREATE TABLE IF NOT EXISTS notes (
+    user TEXT NOT NULL, date TEXT NOT NULL, description TEXT NOT NULL, amount REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_notes_user_date ON notes(user, date);
+CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS partitions (user TEXT NOT NULL, month TEXT NOT NULL, entries INTEGER NOT NULL, PRIMARY KEY (month, user));
+CREATE INDEX IF NOT EXISTS idx_entries_bill_date ON entries(bill, date);
+CREATE TABLE IF NOT EXISTS bill_balances (bill TEXT PRIMARY KEY, user TEXT NOT NULL, party TEXT NOT NULL, date TEXT NOT NULL, balance REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_bill_balances_party ON bill_balances(party);
+CREATE TABLE IF NOT EXISTS party_balances (party TEXT PRIMARY KEY, balance REAL NOT NULL, bills INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user TEXT NOT NULL, date TEXT NOT NULL, entries INTEGER NOT NULL, credit REAL NOT NULL, payment REAL NOT NULL,
+    "return" REAL NOT NULL, discount REAL NOT NULL, notes REAL NOT NULL, PRIMARY KEY (date, user)
+);
+"""
+
+ENTRY_COLUMNS = ("id",) + ENTRY_FIELDS
+_COLUMNS = ", ".join(f'"{f}"' for f in ENTRY_COLUMNS)
+_PLACEHOLDERS = ", ".join("?" for _ in ENTRY_COLUMNS)
+
+def load_json(f, d):
+    if not os.path.exists(f) or os.path.getsize(f) == 0: return d
+    try:
+        with open(f, "r") as fp: return json.load(fp)
+    except (json.JSONDecodeError, FileNotFoundError): return d
+
+def new_entry_id(): return uuid.uuid4().hex
+
+def month_bounds(month):
+    # A month partition is the index key range "YYYY-MM-00" .. "YYYY-MM-99" over ISO date strings.
+    return f"{month}-00", f"{month}-99"
+
+def to_paise(amount): return round(float(amount or 0) * 100)
+
+# --- Compact entry record ---
+# What the store hands out for an entry: fixed slots instead of a per-entry dict, user/date/party interned so
+# thousands of repeats share one string, and amounts held as integer paise. It reads like a read-only dict of the
+# on-disk columns (amounts come back as rupees), so dict(entry) gives the stored layout back unchanged.
+class Entry(Mapping):
+    __slots__ = ("id", "user", "date", "bill", "party", "_credit", "_payment", "_return", "_discount", "_balance")
+
+    def __init__(self, id, user, date, bill, party, credit=0, payment=0, ret=0, discount=0, balance=0):
+        self.id, self.user, self.date, self.bill, self.party = id, sys.intern(user), sys.intern(date), bill, sys.intern(party)
+        self._credit, self._payment, self._return, self._discount, self._balance = to_paise(credit), to_paise(payment), to_paise(ret), to_paise(discount), to_paise(balance)
+
+    @classmethod
+    def from_mapping(cls, e): return cls(*(e[f] for f in ENTRY_COLUMNS))
+
+    def __getitem__(self, key):
+        if key in AMOUNT_FIELDS: return getattr(self, "_" + key) / 100
+        if key in ENTRY_COLUMNS: return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self): return iter(ENTRY_COLUMNS)
+
+    def __len__(self): return len(ENTRY_COLUMNS)
+
+    def __repr__(self): return f"Entry({dict(self)!r})"
+
+    def paise(self, key): return getattr(self, "_" + key)
+
+    def copy(self): return dict(self)
+
+def _entry_values(e):
+    return (e.get("id") or new_entry_id(),) + tuple(str(e.get(f, "") or "") if f not in AMOUNT_FIELDS else float(e.get(f, 0) or 0) for f in ENTRY_FIELDS)
+
+def normalize_party(name): return " ".join(re.sub(r"[^\w\s]", " ", name.lower()).split())
+
+def _trigrams(text): return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# --- Party name index ---
+# Trigram postings over normalized party names: a substring lookup intersects a few small sets instead of
+# lowercasing every entry's party. Each normalized name keeps the spellings typed for it and how often they are used.
+class PartyIndex:
+    def __init__(self):
+        self.counts, self.spellings, self.grams = {}, {}, {}
+
+    def add(self, party, n=1):
+        if not party: return
+        self.counts[party] = self.counts.get(party, 0) + n
+        name = normalize_party(party)
+        if name not in self.spellings:
+            self.spellings[name] = set()
+            for g in _trigrams(name): self.grams.setdefault(g, set()).add(name)
+        self.spellings[name].add(party)
+
+    def remove(self, party):
+        if (count := self.counts.get(party, 0) - 1) > 0:
+            self.counts[party] = count; return
+        self.counts.pop(party, None)
+        name = normalize_party(party)
+        if not (spellings := self.spellings.get(name)): return
+        spellings.discard(party)
+        if spellings: return
+        del self.spellings[name]
+        for g in _trigrams(name):
+            names = self.grams.get(g, set()); names.discard(name)
+            if not names: self.grams.pop(g, None)
+
+    def _names(self, fragment):
+        if len(fragment) < 3: return [n for n in self.spellings if fragment in n]
+        postings = sorted((self.grams.get(g, set()) for g in _trigrams(fragment)), key=len)
+        return [n for n in postings[0].intersection(*postings[1:]) if fragment in n]
+
+    def matching(self, fragment):
+        return [p for n in self._names(normalize_party(fragment)) for p in self.spellings[n]]
+
+    def suggest(self, fragment, limit=PARTY_SUGGESTIONS):
+        # Names starting with the fragment first, then the most used spellings.
+        if not (fragment := normalize_party(fragment)): return []
+        ranked = ((not n.startswith(fragment), -self.counts[p], p) for n in self._names(fragment) for p in self.spellings[n])
+        return [p for *_, p in heapq.nsmallest(limit, ranked)]
+
+# --- Other collections index ---
+# Per user, the dates that have notes in sorted order with each day's total in paise. Range sums bisect the date list
+# and subtract two running totals; a saved day changes one slot of its own user's lists.
+class NotesIndex:
+    def __init__(self):
+        self.dates, self.paise, self.running = {}, {}, {}
+
+    def set_day(self, user, date, paise):
+        dates, amounts = self.dates.setdefault(user, []), self.paise.setdefault(user, [])
+        i = bisect.bisect_left(dates, date)
+        if i < len(dates) and dates[i] == date:
+            if paise: amounts[i] = paise
+            else: del dates[i], amounts[i]
+        elif paise: dates.insert(i, date); amounts.insert(i, paise)
+        else: return
+        self.running.pop(user, None)  # rebuilt on the next range query for this user
+
+    def _span(self, user, date_from, date_to):
+        dates = self.dates.get(user, [])
+        return bisect.bisect_left(dates, date_from), bisect.bisect_right(dates, date_to)
+
+    def total(self, user, date_from, date_to):
+        # Paise over the inclusive range, for one user or (None) everyone.
+        if user is None: return sum(self.total(u, date_from, date_to) for u in self.dates)
+        lo, hi = self._span(user, date_from, date_to)
+        if lo >= hi: return 0
+        if user not in self.running: self.running[user] = [0, *itertools.accumulate(self.paise[user])]
+        return self.running[user][hi] - self.running[user][lo]
+
+class EntryStore:
+    def __init__(self, path, read_only=False):
+        # read_only: a side connection for reports and exports. It never writes, upgrades the schema or
+        # checkpoints, so opening one doesn't move the app connection's data_version or fold its journal.
+        self.path, self.read_only = path, read_only
+        self._compact_lock = threading.Lock()
+        self._batch_depth = 0
+        self._cache, self._data_version = {}, None  # small, often-read results shared by every screen; see _cached
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            # Write-ahead journal: each commit appends only its changed pages to "<db>-wal" and is replayed
+            # on open after a crash. Automatic checkpoints are off; _maybe_compact folds the journal in the background.
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=FULL")  # fsync every commit; IOWorker groups writes so this is one fsync per burst
+            self.conn.execute("PRAGMA wal_autocheckpoint=0")
+            self.conn.executescript(SCHEMA)
+            self._upgrade_schema()
+        self._latest_by_bill = None  # bill -> most recently saved entry, built on first lookup
+        self._parties = None  # PartyIndex over every entry's party, built on first search
+        self._notes = None  # NotesIndex of per-day other collections, built on first total
+
+    def close(self):
+        if not self.read_only: self.compact()
+        self.conn.close()
+
+    # --- Read cache ---
+    def _revalidate(self):
+        # data_version moves when another connection changes the file (e.g. the report CLI), so it plays the part of a
+        # file's mtime/size: unchanged means every cached result is still current. Our own writes keep the cache in
+        # step, and compact() absorbs the bump its own checkpoint causes.
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version, self._latest_by_bill, self._parties, self._notes = version, None, None, None
+            self._cache.clear()
+
+    def _cached(self, key, load):
+        self._revalidate()
+        if key not in self._cache: self._cache[key] = load()
+        return self._cache[key]
+
+    def _forget_months(self):
+        for key in [k for k in self._cache if k[0] in ("months", "entry_users")]: del self._cache[key]
+
+    # --- Journal compaction ---
+    @contextlib.contextmanager
+    def _transaction(self):
+        if self._batch_depth:
+            yield self.conn; return
+        with self.conn: yield self.conn
+        self._maybe_compact()
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Groups several writes into a single commit; their own _transaction blocks join this one.
+        self._batch_depth += 1
+        try:
+            with self.conn: yield self
+        except Exception:
+            self._latest_by_bill = self._parties = self._notes = None  # may hold changes from the rolled-back writes
+            self._cache.clear()
+            raise
+        finally:
+            self._batch_depth -= 1
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        try: journal_size = os.path.getsize(self.path + "-wal")
+        except OSError: return
+        if journal_size > JOURNAL_COMPACT_BYTES and not self._compact_lock.locked():
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        if not self._compact_lock.acquire(blocking=False): return
+        try:
+            # A separate connection so the checkpoint never holds up the UI's connection.
+            # The checkpoint moves this connection's data_version without changing any data; if the cache was current
+            # before it, it still is afterwards. (A commit from elsewhere landing during the checkpoint is missed.)
+            before = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            conn = sqlite3.connect(self.path, timeout=5)
+            try: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally: conn.close()
+            if self._data_version == before: self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Journal compaction failed: {e}")
+        finally:
+            self._compact_lock.release()
+
+    def _upgrade_schema(self):
+        # Databases created before entry IDs existed get the column added and backfilled once.
+        columns = {r['name'] for r in self.conn.execute("PRAGMA table_info(entries)")}
+        with self._transaction():
+            if "id" not in columns: self.conn.execute("ALTER TABLE entries ADD COLUMN id TEXT")
+            self.conn.execute("UPDATE entries SET id = lower(hex(randomblob(16))) WHERE id IS NULL")
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_entries_id ON entries(id)")
+            if not self.conn.execute("SELECT 1 FROM meta WHERE key = 'partitions_built'").fetchone(): self._rebuild_partitions()
+            if not self.conn.execute("SELECT 1 FROM meta WHERE key = 'balances_built'").fetchone(): self._rebuild_balances()
+            if not self.conn.execute("SELECT 1 FROM meta WHERE key = 'rollups_built'").fetchone(): self._rebuild_rollups()
+
+    # --- Month partition manifest ---
+    def _rebuild_partitions(self):
+        self.conn.execute("DELETE FROM partitions")
+        self.conn.execute("INSERT INTO partitions (user, month, entries) SELECT user, substr(date, 1, 7), COUNT(*) FROM entries GROUP BY 1, 2")
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('partitions_built', '1')")
+        self._forget_months()
+
+    def _touch_partition(self, user, date):
+        month = date[:7]
+        count = self.conn.execute("SELECT COUNT(*) FROM entries WHERE user = ? AND date BETWEEN ? AND ?", (user,) + month_bounds(month)).fetchone()[0]
+        if count: self.conn.execute("INSERT OR REPLACE INTO partitions (user, month, entries) VALUES (?, ?, ?)", (user, month, count))
+        else: self.conn.execute("DELETE FROM partitions WHERE user = ? AND month = ?", (user, month))
+        self._forget_months()
+
+    def months(self, user=None):
+        def load():
+            if user is None: rows = self.conn.execute("SELECT month FROM partitions GROUP BY month ORDER BY month DESC")
+            else: rows = self.conn.execute("SELECT month FROM partitions WHERE user = ? ORDER BY month DESC", (user,))
+            return [r[0] for r in rows]
+        return list(self._cached(("months", user), load))
+
+    # --- Outstanding balances (materialized per bill and per party) ---
+    # bill_balances holds each bill's latest entry by date; party_balances sums them. Writes adjust both for the
+    # bills they touch inside the same transaction, so reading the view never scans the entries table.
+    def _rebuild_balances(self):
+        self.conn.execute("DELETE FROM bill_balances")
+        self.conn.execute("DELETE FROM party_balances")
+        self.conn.execute("""INSERT INTO bill_balances (bill, user, party, date, balance)
+            SELECT bill, user, party, date, balance FROM entries WHERE rowid IN (
+                SELECT (SELECT rowid FROM entries x WHERE x.bill = b.bill ORDER BY date DESC, rowid DESC LIMIT 1) FROM (SELECT DISTINCT bill FROM entries) b)""")
+        self.conn.execute("INSERT INTO party_balances (party, balance, bills) SELECT party, SUM(balance), COUNT(*) FROM bill_balances GROUP BY party")
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('balances_built', '1')")
+
+    def _balance_source(self, bill):
+        # The bill's latest entry by (date, rowid), as {user, party, date, balance}; None once it has no entries.
+        return self.conn.execute("SELECT user, party, date, balance FROM entries WHERE bill = ? ORDER BY date DESC, rowid DESC LIMIT 1", (bill,)).fetchone()
+
+    def _refresh_balances(self, bills):
+        for bill in bills:
+            old = self.conn.execute("SELECT party, balance FROM bill_balances WHERE bill = ?", (bill,)).fetchone()
+            new = self._balance_source(bill)
+            if old: self.conn.execute("UPDATE party_balances SET balance = balance - ?, bills = bills - 1 WHERE party = ?", (old['balance'], old['party']))
+            if new:
+                self.conn.execute("INSERT OR REPLACE INTO bill_balances (bill, user, party, date, balance) VALUES (?, ?, ?, ?, ?)", (bill, new['user'], new['party'], new['date'], new['balance']))
+                self.conn.execute("INSERT INTO party_balances (party, balance, bills) VALUES (?, ?, 1) ON CONFLICT(party) DO UPDATE SET balance = balance + excluded.balance, bills = bills + 1", (new['party'], new['balance']))
+            else: self.conn.execute("DELETE FROM bill_balances WHERE bill = ?", (bill,))
+        self.conn.execute("DELETE FROM party_balances WHERE bills <= 0")
+
+    def party_balances(self):
+        rows = self.conn.execute("SELECT party, balance, bills FROM party_balances WHERE abs(balance) >= 0.005 ORDER BY balance DESC")
+        return [{'party': r['party'], 'balance': round(r['balance'], 2), 'bills': r['bills']} for r in rows]
+
+    def bill_balances(self, party):
+        rows = self.conn.execute("SELECT bill, user, date, balance FROM bill_balances WHERE party = ? AND abs(balance) >= 0.005 ORDER BY date DESC", (party,))
+        return [dict(r) for r in rows]
+
+    # --- Daily rollups ---
+    # One row of sums per user-day, rewritten for the days each write touches. Dashboard ranges aggregate these
+    # rows, so a month costs at most ~31 rows per user however many entries it holds.
+    def _rebuild_rollups(self):
+        self.conn.execute("DELETE FROM daily_rollups")
+        self.conn.execute("""INSERT INTO daily_rollups (user, date, entries, credit, payment, "return", discount, notes)
+            SELECT user, date, SUM(n), TOTAL(credit), TOTAL(payment), TOTAL("return"), TOTAL(discount), TOTAL(notes) FROM (
+                SELECT user, date, 1 AS n, credit, payment, "return", discount, 0 AS notes FROM entries
+                UNION ALL SELECT user, date, 0, 0, 0, 0, 0, amount FROM notes) GROUP BY user, date""")
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollups_built', '1')")
+
+    def _touch_rollup(self, user, date):
+        sums = self.conn.execute('SELECT COUNT(*), TOTAL(credit), TOTAL(payment), TOTAL("return"), TOTAL(discount) FROM entries WHERE user = ? AND date = ?', (user, date)).fetchone()
+        notes = self.conn.execute("SELECT COUNT(*), TOTAL(amount) FROM notes WHERE user = ? AND date = ?", (user, date)).fetchone()
+        if sums[0] or notes[0]: self.conn.execute('INSERT OR REPLACE INTO daily_rollups (user, date, entries, credit, payment, "return", discount, notes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (user, date) + tuple(sums) + (notes[1],))
+        else: self.conn.execute("DELETE FROM daily_rollups WHERE user = ? AND date = ?", (user, date))
+
+    def rollup_totals(self, date_from, date_to, group="user", user=None):
+        # Sums per user, day ("YYYY-MM-DD") or month ("YYYY-MM") over an inclusive date range, ordered by key.
+        clauses, params = ["date BETWEEN ? AND ?"], [date_from, date_to]
+        if user is not None: clauses.append("user = ?"); params.append(user)
+        sums = ", ".join(f'{"SUM" if f == "entries" else "TOTAL"}("{f}") AS "{f}"' for f in ROLLUP_SUMS)
+        rows = self.conn.execute(f"SELECT {ROLLUP_GROUPS[group]} AS key, {sums} FROM daily_rollups WHERE {' AND '.join(clauses)} GROUP BY 1 ORDER BY 1", params)
+        return [dict(r) for r in rows]
+
+    # --- Entries ---
+    def entries_for_day(self, user, date):
+        rows = self.conn.execute(f"SELECT {_COLUMNS} FROM entries WHERE user = ? AND date = ? ORDER BY rowid", (user, date))
+        return [Entry(*r) for r in rows]
+
+    def _filter_clauses(self, user=None, date_from=None, date_to=None, party=None, bill=None):
+        # WHERE clauses and parameters for the ledger filters, or None when the party matches nothing.
+        clauses, params = [], []
+        if user is not None: clauses.append("user = ?"); params.append(user)
+        if date_from and date_from == date_to: clauses.append("date = ?"); params.append(date_from)
+        else:
+            if date_from: clauses.append("date >= ?"); params.append(date_from)
+            if date_to: clauses.append("date <= ?"); params.append(date_to)
+        if party and len(parties := self._party_index().matching(party)) <= PARTY_IN_LIMIT:
+            if not parties: return None
+            clauses.append(f"party IN ({', '.join('?' for _ in parties)})"); params.extend(parties)
+        elif party: clauses.append("party LIKE ? ESCAPE '\\'"); params.append("%" + party.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if bill: clauses.append("bill = ?"); params.append(bill)
+        return clauses, params
+
+    def find_entries(self, user=None, date=None, party=None, bill=None, order_by=("date", "bill")):
+        if (found := self._filter_clauses(user, date, date, party, bill)) is None: return []
+        clauses, params = found
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = ", ".join(f'"{c}" DESC' for c in order_by)
+        return [Entry(*r) for r in self.conn.execute(f"SELECT {_COLUMNS} FROM entries {where} ORDER BY {order}", params)]
+
+    def page_entries(self, user=None, month=None, after=None, limit=50):
+        # Keyset pagination newest-first on (date, user, rowid): each page is an index range scan, not an OFFSET skip.
+        clauses, params = [], []
+        if user is not None: clauses.append("user = ?"); params.append(user)
+        if month is not None: clauses.append("date BETWEEN ? AND ?"); params.extend(month_bounds(month))
+        if after is not None: clauses.append("(date, user, rowid) < (?, ?, ?)"); params.extend(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.conn.execute(f"SELECT rowid, {_COLUMNS} FROM entries {where} ORDER BY date DESC, user DESC, rowid DESC LIMIT ?", params + [limit]).fetchall()
+        cursor = (rows[-1]['date'], rows[-1]['user'], rows[-1]['rowid']) if len(rows) == limit else None
+        return [Entry.from_mapping(r) for r in rows], cursor
+
+    # --- Latest entry per bill (in-memory index) ---
+    def _bill_index(self):
+        if self._latest_by_bill is None:
+            # Latest by (date, rowid), the order bill_balances and the carry-forward chain use.
+            rows = self.conn.execute(f"""SELECT {_COLUMNS} FROM entries WHERE rowid IN (
+                SELECT (SELECT rowid FROM entries x WHERE x.bill = b.bill ORDER BY date DESC, rowid DESC LIMIT 1) FROM (SELECT DISTINCT bill FROM entries) b)""")
+            self._latest_by_bill = {r['bill']: Entry(*r) for r in rows}
+        return self._latest_by_bill
+
+    def _refresh_bills(self, bills):
+        if self._latest_by_bill is None: return
+        for bill in bills:
+            row = self.conn.execute(f"SELECT {_COLUMNS} FROM entries WHERE bill = ? ORDER BY date DESC, rowid DESC LIMIT 1", (bill,)).fetchone()
+            if row: self._latest_by_bill[bill] = Entry(*row)
+            else: self._latest_by_bill.pop(bill, None)
+
+    def latest_for_bill(self, bill):
+        self._revalidate()
+        return self._bill_index().get(bill)
+
+    # --- Party names (in-memory trigram index) ---
+    def _party_index(self):
+        self._revalidate()
+        if self._parties is None:
+            self._parties = PartyIndex()
+            for party, n in self.conn.execute("SELECT party, COUNT(*) FROM entries GROUP BY party"): self._parties.add(party, n)
+        return self._parties
+
+    def _refresh_parties(self, removed, added):
+        if self._parties is None: return
+        for party in removed: self._parties.remove(party)
+        for party in added: self._parties.add(party)
+
+    def suggest_parties(self, fragment, limit=PARTY_SUGGESTIONS):
+        return self._party_index().suggest(fragment, limit)
+
+    # --- Carried-forward chains ---
+    def _cascade(self, bill, date, rowid, old_balance, new_balance):
+        # Walks the bill's later entries in (date, rowid) order along idx_entries_bill_date. Each entry whose credit was
+        # carried from the old balance takes the new one and gets its balance recomputed. The walk stops at the first
+        # entry with a hand-entered credit, or once the balance it would pass on is unchanged.
+        changed = []
+        rows = self.conn.execute(f"SELECT {_COLUMNS} FROM entries WHERE bill = ? AND (date, rowid) > (?, ?) ORDER BY date, rowid", (bill, date, rowid)).fetchall()
+        for r in rows:
+            if abs(new_balance - old_balance) < 0.005 or abs(r['credit'] - old_balance) >= 0.005: break
+            entry = Entry.from_mapping(dict(r, credit=new_balance, balance=round(new_balance - (r['payment'] + r['return'] + r['discount']), 2)))
+            old_balance, new_balance = r['balance'], entry['balance']
+            changed.append(entry)
+        self.conn.executemany("UPDATE entries SET credit = ?, balance = ? WHERE id = ?", [(e['credit'], e['balance'], e['id']) for e in changed])
+        for day in {(e['user'], e['date']) for e in changed}: self._touch_rollup(*day)
+        return changed
+
+    def replace_day(self, user, date, entries, notes):
+        # Returns the later entries whose carried-forward credit changed as a result.
+        values = [_entry_values(e) for e in entries]
+        with self._transaction():
+            removed = self.conn.execute("SELECT bill, party, balance FROM entries WHERE user = ? AND date = ? ORDER BY rowid", (user, date)).fetchall()
+            self.conn.execute("DELETE FROM entries WHERE user = ? AND date = ?", (user, date))
+            self.conn.executemany(f"INSERT INTO entries ({_COLUMNS}) VALUES ({_PLACEHOLDERS})", values)
+            self.conn.execute("DELETE FROM notes WHERE user = ? AND date = ?", (user, date))
+            self.conn.executemany("INSERT INTO notes (user, date, description, amount) VALUES (?, ?, ?, ?)", [(user, date, n.get('description', ''), float(n.get('amount', 0) or 0)) for n in notes])
+            self._touch_partition(user, date)
+            self._touch_rollup(user, date)
+            old_balances, changed = {r['bill']: r['balance'] for r in removed}, []
+            for bill, new_balance in {v[3]: v[9] for v in values}.items():
+                if bill not in old_balances: continue
+                rowid = self.conn.execute("SELECT MAX(rowid) FROM entries WHERE bill = ? AND user = ? AND date = ?", (bill, user, date)).fetchone()[0]
+                changed += self._cascade(bill, date, rowid, old_balances[bill], new_balance)
+            self._refresh_balances(set(old_balances) | {v[3] for v in values})
+        # A re-saved older day is not necessarily the latest for its bills, so each touched bill is looked up again.
+        self._refresh_bills({r[0] for r in removed} | {v[3] for v in values} | {e['bill'] for e in changed})
+        self._refresh_parties([r[1] for r in removed], [v[4] for v in values])
+        if self._notes is not None: self._notes.set_day(user, date, sum(to_paise(n.get('amount')) for n in notes))
+        return changed
+
+    def update_entry(self, entry_id, updated):
+        # Returns every entry written: the edited one first, then any later entries of its bill re-carried from it.
+        with self._transaction():
+            row = self.conn.execute("SELECT rowid, user, date, bill, party, balance FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            if row is None: return []
+            assignments = ", ".join(f'"{f}" = ?' for f in ENTRY_FIELDS)
+            values = _entry_values(updated)
+            self.conn.execute(f"UPDATE entries SET {assignments} WHERE id = ?", values[1:] + (entry_id,))
+            if (row['user'], row['date'][:7]) != (values[1], values[2][:7]):
+                self._touch_partition(row['user'], row['date']); self._touch_partition(values[1], values[2])
+            for day in {(row['user'], row['date']), (values[1], values[2])}: self._touch_rollup(*day)
+            changed = [Entry(entry_id, *values[1:])]
+            if (values[2], values[3]) == (row['date'], row['bill']): changed += self._cascade(row['bill'], row['date'], row['rowid'], row['balance'], values[9])
+            self._refresh_balances({row['bill'], values[3]})
+        self._refresh_bills({row['bill'], values[3]})
+        self._refresh_parties([row['party']], [values[4]])
+        return changed
+
+    def delete_entry(self, entry_id):
+        # Returns the deleted entry, then any later entries of its bill re-carried from the entry before it.
+        with self._transaction():
+            row = self.conn.execute(f"SELECT rowid, {_COLUMNS} FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            if row is None: return []
+            previous = self.conn.execute("SELECT balance FROM entries WHERE bill = ? AND (date, rowid) < (?, ?) ORDER BY date DESC, rowid DESC LIMIT 1", (row['bill'], row['date'], row['rowid'])).fetchone()
+            self.conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+            changed = [Entry.from_mapping(row)]
+            if previous: changed += self._cascade(row['bill'], row['date'], row['rowid'], row['balance'], previous[0])
+            self._touch_partition(row['user'], row['date'])
+            self._touch_rollup(row['user'], row['date'])
+            self._refresh_balances({row['bill']})
+        self._refresh_bills({row['bill']})
+        self._refresh_parties([row['party']], [])
+        return changed
+
+    # --- Notes ---
+    def notes_for_day(self, user, date):
+        rows = self.conn.execute("SELECT description, amount FROM notes WHERE user = ? AND date = ? ORDER BY rowid", (user, date))
+        return [{'description': r['description'], 'amount': r['amount']} for r in rows]
+
+    def _notes_index(self):
+        # Built from the daily rollups, which keep their notes column for archived years too.
+        self._revalidate()
+        if self._notes is None:
+            self._notes = NotesIndex()
+            for r in self.conn.execute("SELECT user, date, notes FROM daily_rollups WHERE notes != 0 ORDER BY user, date"): self._notes.set_day(r[0], r[1], to_paise(r[2]))
+        return self._notes
+
+    def notes_total(self, date_from, date_to, user=None):
+        # Other collections over an inclusive date range, for one user or everyone.
+        return self._notes_index().total(user, date_from, date_to) / 100
+
+    # --- Report snapshots ---
+    def entry_users(self):
+        return list(self._cached(("entry_users",), lambda: [r[0] for r in self.conn.execute("SELECT DISTINCT user FROM partitions ORDER BY user")]))
+
+    def iter_entries(self, user, date_from, date_to, chunk_size=500):
+        # Streams a user's range in date order a chunk at a time instead of materialising the list.
+        cursor = self.conn.execute(f"SELECT {_COLUMNS} FROM entries WHERE user = ? AND date BETWEEN ? AND ? ORDER BY date, rowid", (user, date_from, date_to))
+        while rows := cursor.fetchmany(chunk_size):
+            for r in rows: yield Entry(*r)
+
+    def iter_filtered(self, user=None, date_from=None, date_to=None, party=None, bill=None, chunk_size=500):
+        # The ledger filters over any date range, streamed oldest first a chunk at a time for spreadsheet exports.
+        # The order matches idx_entries_date_user (and idx_entries_user_date for one user), so SQLite can walk an index.
+        if (found := self._filter_clauses(user, date_from, date_to, party, bill)) is None: return
+        clauses, params = found
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        cursor = self.conn.execute(f"SELECT {_COLUMNS} FROM entries {where} ORDER BY date, user, rowid", params)
+        while rows := cursor.fetchmany(chunk_size):
+            for r in rows: yield Entry(*r)
+
+    def day_snapshots(self, users, date_from, date_to):
+        # Plain (user, date, entries, notes) tuples for every user-day in range, safe to hand to other processes.
+        if users is None: users = self.entry_users()
+        snapshots = []
+        for user in users:
+            days = {}
+            for r in self.conn.execute(f"SELECT {_COLUMNS} FROM entries WHERE user = ? AND date BETWEEN ? AND ? ORDER BY date, rowid", (user, date_from, date_to)):
+                days.setdefault(r['date'], ([], []))[0].append(dict(r))
+            for r in self.conn.execute("SELECT date, description, amount FROM notes WHERE user = ? AND date BETWEEN ? AND ? ORDER BY date, rowid", (user, date_from, date_to)):
+                days.setdefault(r['date'], ([], []))[1].append({'description': r['description'], 'amount': r['amount']})
+            snapshots.extend((user, date, entries, notes) for date, (entries, notes) in sorted(days.items()))
+        return snapshots
+
+    # --- Users ---
+    def _users(self):
+        return self._cached(("users",), lambda: {r['username']: r['password'] for r in self.conn.execute("SELECT username, password FROM users ORDER BY username")})
+
+    def get_users(self):
+        return dict(self._users())
+
+    def get_password(self, username):
+        return self._users().get(username)
+
+    def add_user(self, username, password):
+        users = self._users()
+        with self._transaction():
+            added = self.conn.execute("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)", (username, password)).rowcount > 0
+        if added: users[username] = password
+        return added
+
+    def delete_user(self, username):
+        users = self._users()
+        with self._transaction(): self.conn.execute("DELETE FROM users WHERE username = ?", (username,))
+        users.pop(username, None)
+
+    # --- One-time migration from the legacy JSON files ---
+    def migrate_from_json(self, data_file, notes_file, users_file):
+        return self.migrate(lambda: (load_json(data_file, []), load_json(notes_file, {}), load_json(users_file, {})))
+
+    def migrate(self, load):
+        # load() returns the legacy layout (entry list, {"<user>_<date>": [notes]}, {user: password}); it is only
+        # called if this database has not been migrated yet.
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone(): return False
+        entries, notes, users = load()
+        entries = [e for e in entries if isinstance(e, Mapping)]
+        self._latest_by_bill = self._parties = self._notes = None
+        self._cache.clear()
+        with self._transaction():
+            self.conn.executemany(f"INSERT INTO entries ({_COLUMNS}) VALUES ({_PLACEHOLDERS})", [_entry_values(e) for e in entries])
+            for key, day_notes in notes.items():
+                # Legacy keys are f"{username}_{date}"; dates never contain '_' so split from the right.
+                user, _, date = key.rpartition("_")
+                self.conn.executemany("INSERT INTO notes (user, date, description, amount) VALUES (?, ?, ?, ?)", [(user, date, n.get('description', ''), float(n.get('amount', 0) or 0)) for n in day_notes if isinstance(n, dict)])
+            self.conn.executemany("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)", list(users.items()))
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+            self._rebuild_partitions()
+            self._rebuild_balances()
+            self._rebuild_rollups()
+        return True
+
+# --- Day cache ---
+# LRU of (user, date) -> (entries, notes) for the daily entry screen. Only touched from the UI thread.
+# Every invalidation bumps the key's version, so a prefetch read that started before a save can't put stale rows back.
+class DayCache:
+    def __init__(self, max_days=DAY_CACHE_SIZE):
+        self.max_days, self.days, self.versions = max_days, OrderedDict(), {}
+
+    def __contains__(self, key): return key in self.days
+
+    def version(self, key): return self.versions.get(key, 0)
+
+    def get(self, key):
+        day = self.days.get(key)
+        if day is not None: self.days.move_to_end(key)
+        return day
+
+    def put(self, key, day, version=None):
+        if version is not None and version != self.version(key): return False
+        self.days[key] = day; self.days.move_to_end(key)
+        while len(self.days) > self.max_days: self.days.popitem(last=False)
+        return True
+
+    def invalidate(self, key):
+        self.days.pop(key, None)
+        self.versions[key] = self.version(key) + 1
+
+# --- Background I/O worker ---
+# Owns the store's connection once started: every read and write is queued here so none run on the UI thread.
+# Results come back through `deliver(callback, *args)`, which the app points at Clock.schedule_once.
+class IOWorker:
+    def __init__(self, store, deliver, commit_delay=0.25):
+        self.store, self.deliver, self.commit_delay = store, deliver, commit_delay
+        self.jobs = queue.Queue()
+        self.pending_writes = {}  # (fn, coalescing key) -> [fn, args, callbacks, error_callbacks], in commit order
+        self.thread = threading.Thread(target=self._run, name="dsr-io", daemon=True)
+        self.thread.start()
+
+    def read(self, fn, *args, callback=None, error_callback=None):
+        self.jobs.put(("read", None, fn, args, callback, error_callback))
+
+    def write(self, fn, *args, key=None, callback=None, error_callback=None):
+        # Writes of the same function sharing a key (e.g. one user's day) replace each other until the next group
+        # commit; every merged caller gets the surviving write's result or error.
+        self.jobs.put(("write", key, fn, args, callback, error_callback))
+
+    def write_alone(self, fn, *args, callback=None, error_callback=None):
+        # A write that manages its own transactions (and files), e.g. archiving: it runs after the pending group
+        # commit, outside any batch, and is never retried.
+        self.jobs.put(("alone", None, fn, args, callback, error_callback))
+
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            try: job = self.jobs.get(timeout=self.commit_delay if self.pending_writes else None)
+            except queue.Empty:
+                self._commit(); continue
+            if job is None:
+                self._commit(); return
+            kind, key, fn, args, callback, error_callback = job
+            if kind == "write":
+                key = (fn, key) if key is not None else object()
+                superseded = self.pending_writes.pop(key, None)
+                callbacks = (superseded[2] if superseded else []) + ([callback] if callback else [])
+                error_callbacks = (superseded[3] if superseded else []) + ([error_callback] if error_callback else [])
+                self.pending_writes[key] = [fn, args, callbacks, error_callbacks]
+            else:
+                self._commit()  # a read (or a lone write) must see every write queued before it
+                self._run_job(fn, args, [callback] if callback else [], [error_callback] if error_callback else [])
+
+    def _run_job(self, fn, args, callbacks, error_callbacks):
+        try: result = fn(*args)
+        except Exception as e:
+            for error_callback in error_callbacks: self.deliver(error_callback, e)
+            if not error_callbacks: print(f"Background I/O failed: {e}")
+            return
+        for callback in callbacks: self.deliver(callback, result)
+
+    def _commit(self):
+        if not self.pending_writes: return
+        jobs, self.pending_writes = list(self.pending_writes.values()), {}
+        try:
+            with self.store.batch(): results = [fn(*args) for fn, args, _, _ in jobs]
+        except Exception:
+            # One failing write must not sink the rest of the group; retry them one commit each.
+            for job in jobs: self._run_job(*job)
+            return
+        for (_, _, callbacks, _), result in zip(jobs, results):
+            for callback in callbacks: self.deliver(callback, result)